@@ -1,11 +1,15 @@
+import logging
+
 from django.conf import settings
 from django.contrib import messages
+from django.db import transaction
 from django.http import HttpResponseRedirect
-from django.utils.module_loading import import_string
 from django.views.generic.edit import BaseFormView
 from django.utils.translation import gettext as _
 
 from osis_export.api.forms import ExportForm
+from osis_export.contrib.registry import get_async_manager_class, get_class
+from osis_export.tasks.generate_export_file import dispatch
 
 
 class AsyncExport(BaseFormView):
@@ -40,7 +44,7 @@ class AsyncExport(BaseFormView):
         async_task_ttl = cleaned_data.get("async_task_ttl", None)
         if async_task_ttl is not None:
             async_task_kwargs["time_to_live"] = async_task_ttl
-        task_manager = import_string(settings.OSIS_EXPORT_ASYNCHRONOUS_MANAGER_CLS)
+        task_manager = get_async_manager_class()
         async_task_uuid = task_manager.create(**async_task_kwargs)
 
         export = form.save(commit=False)
@@ -48,7 +52,27 @@ class AsyncExport(BaseFormView):
         export.person = person
         export.type = cleaned_data.get("type")
         export.file_name = cleaned_data.get("file_name")
+        base_class = get_class(export.called_from_class)
+        export.priority = getattr(base_class, "export_priority", 0)
+        # used to generate only once the identical exports requested at the same time
+        export.request_fingerprint = export.get_request_fingerprint(
+            export.get_language(),
+            getattr(base_class, "export_person_specific", True),
+        )
         export.save()
 
+        if getattr(settings, "OSIS_EXPORT_GENERATE_ON_CREATION", False):
+            # do not wait for the periodic task, which then only picks up the
+            # exports that could not be generated this way
+            transaction.on_commit(lambda: self.dispatch_generation(export))
+
         # redirect to the initial page
         return HttpResponseRedirect(self.request.POST.get("next", "/"))
+
+    @staticmethod
+    def dispatch_generation(export):
+        try:
+            dispatch([export])
+        except Exception as e:
+            # e.g. the broker is unavailable, the export is then generated by the periodic task
+            logging.getLogger(settings.DEFAULT_LOGGER).exception(e)
@@ -1,16 +1,20 @@
 import abc
 import datetime
 import uuid
+from typing import Dict, Iterable, List, Tuple
 from uuid import UUID
 
 from base.models.person import Person
 from osis_async.models.enums import TaskState
+from osis_notification.models import WebNotification
 
 
 class AsyncManager(abc.ABC):
     @staticmethod
-    def get_pending_job_uuids() -> [UUID]:
-        """Must return the pending export job uuids"""
+    def get_pending_job_uuids() -> Iterable[UUID]:
+        """Must return the pending export job uuids. Return them as a queryset of uuids
+        (e.g. using values_list('uuid', flat=True)) rather than a list, so that the pending
+        exports are selected by a single query, without loading all the uuids."""
         raise NotImplementedError
 
     @staticmethod
@@ -29,3 +33,16 @@ class AsyncManager(abc.ABC):
     def create(name: str, description: str, person: Person, time_to_live: int = None) -> uuid.UUID:
         """Create the async task with all the given parameters, must return an uuid."""
         raise NotImplementedError
+
+    @classmethod
+    def bulk_update(cls, updates: List[Tuple[UUID, Dict]]) -> None:
+        """Update each async task with the given uuid with the given parameters (the ones
+        of update). Override it to update them at once."""
+        for uuid, kwargs in updates:
+            cls.update(uuid, **kwargs)
+
+    @classmethod
+    def bulk_create_notifications(cls, notifications: List[WebNotification]) -> None:
+        """Save the given notifications. Override it to save them at once."""
+        for notification in notifications:
+            notification.save()
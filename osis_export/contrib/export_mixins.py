@@ -1,31 +1,91 @@
 import ast
+import csv
 import datetime
-from tempfile import NamedTemporaryFile
-from typing import Dict
-
-from django.core.exceptions import ValidationError, ImproperlyConfigured
-from django.db.models import QuerySet
+import gzip
+import io
+import itertools
+import shutil
+import zipfile
+from tempfile import SpooledTemporaryFile
+from typing import IO, Any, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple, Union
+
+import django
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist, ValidationError, ImproperlyConfigured
+from django.db.models import Max, QuerySet
 from django.http import QueryDict
 from django.utils.formats import date_format
+from django.utils.functional import cached_property
 from django.utils.html import format_html
-from django.utils.translation import gettext as _, gettext_lazy
+from django.utils.translation import get_language, gettext as _, gettext_lazy
 from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.styles import Font
 from openpyxl.worksheet.worksheet import Worksheet
 
 from base.models.person import Person
+from osis_export.contrib.metrics import ExportMetrics, ExportQueryBudgetExceeded
+from osis_export.contrib.progress import ExportProgress
+from osis_export.contrib.snapshots import ExportSnapshot, get_snapshot_key, get_snapshot_lag, get_snapshot_root
 from osis_notification.models import WebNotification
 
 
+def can_iterate_by_chunks(queryset: QuerySet) -> bool:
+    """Whether the queryset can be iterated by chunks without losing its prefetched
+    related objects, iterator() ignoring prefetch_related() before Django 4.1"""
+    return django.VERSION >= (4, 1) or not queryset._prefetch_related_lookups
+
+
 class ExportMixin:
+    # Exports with the highest priority are generated first
+    export_priority = 0
+
     def get_export_objects(self, **kwargs):
         raise NotImplementedError
 
+    def get_export_cost(self, **kwargs) -> Optional[int]:
+        """Return an estimation of the cost of the export (e.g. its number of rows),
+        used to generate the smallest exports first. None if unknown."""
+        return None
+
+    def iter_export_objects(self, **kwargs):
+        """Iterate over the exported objects, override it to stream them"""
+        if kwargs.pop("fields", None):
+            # the objects would be given as is to format_columns
+            raise ImproperlyConfigured("Exporting columns requires a QuerySetExportMixin")
+        return iter(self.get_export_objects(**kwargs))
+
 
 class QuerySetExportMixin(ExportMixin):
+    # Number of rows fetched at once from the database (using a server-side cursor
+    # on PostgreSQL) while iterating over the exported queryset. Set it to None to
+    # load the whole queryset in memory at once, as done for the querysets with
+    # prefetched related objects before Django 4.1.
+    export_chunk_size = 2000
+
     def get_export_objects(self, **kwargs):
         return self.get_queryset_export(kwargs.get("filters"))
 
+    def get_export_cost(self, **kwargs) -> Optional[int]:
+        return self.get_export_objects(**kwargs).count()
+
+    def iter_export_objects(self, **kwargs):
+        fields = kwargs.pop("fields", None)
+        export_objects = self.get_export_objects(**kwargs)
+        if fields:
+            # only the values of the given fields are exported, do not build the objects
+            if not isinstance(export_objects, QuerySet):
+                raise ImproperlyConfigured("Exporting fields requires a queryset")
+            export_objects = export_objects.values_list(*fields)
+        if (
+            self.export_chunk_size is None
+            or not isinstance(export_objects, QuerySet)
+            or not can_iterate_by_chunks(export_objects)
+        ):
+            return iter(export_objects)
+        # do not fill the queryset result cache
+        return export_objects.iterator(chunk_size=self.export_chunk_size)
+
     def get_queryset_export(self, filters) -> QuerySet:
         raise NotImplementedError
 
@@ -45,10 +105,72 @@ class FilterSetExportMixin(QuerySetExportMixin):
 class FileExportMixin:
     file_extension = None
     mimetype = None
+    # When True, the file of a previous export with the same filters and the same
+    # data version (see get_export_data_version) is reused instead of being generated
+    export_result_cache = False
+    # Whether the generated file depends on the person requesting it (e.g. on their
+    # permissions, or in the parameters worksheet); if so, it is never shared with others
+    export_person_specific = True
+    # The progression of the generation is reported at most every N rows and N seconds
+    export_progress_every_rows = 1000
+    export_progress_interval = 5
+    # Size of the generated file kept in memory before being written on disk
+    max_memory_size = 10 * 1024 * 1024
+    # When True, the generated file is bundled into a zip archive
+    zip_archive = False
 
     def generate_file(self, person, filters):
+        """Must return the generated file, as a binary file object (or bytes) that
+        will be closed once uploaded"""
         raise NotImplementedError
 
+    def is_archived(self) -> bool:
+        """Whether the uploaded file is a zip archive bundling the generated files"""
+        return self.zip_archive
+
+    def generate_export_file(self, person, filters, file_name: str):
+        """Return the file to upload: the generated file, bundled into a zip archive if needed"""
+        if not self.is_archived():
+            return self.generate_file(person=person, filters=filters)
+        return self.create_archive(
+            [
+                ("{}{}".format(file_name, self.get_file_extension()), self.generate_file(person=person, filters=filters)),
+            ]
+        )
+
+    def create_archive(self, files: Iterable[Tuple[str, Union[bytes, IO[bytes]]]]) -> IO[bytes]:
+        """Return a zip archive of the given files, each one closed once added"""
+        tmp = self.create_temporary_file()
+        with zipfile.ZipFile(tmp, mode="w", compression=zipfile.ZIP_DEFLATED) as archive:
+            for name, file in files:
+                if isinstance(file, bytes):
+                    archive.writestr(name, file)
+                    continue
+                # the size of the file is unknown before it is written, it may exceed 2 GiB
+                with file, archive.open(name, mode="w", force_zip64=True) as archived_file:
+                    shutil.copyfileobj(file, archived_file)
+        tmp.seek(0)
+        return tmp
+
+    def create_temporary_file(self) -> IO[bytes]:
+        """Return the temporary file in which the file is generated, deleted once closed"""
+        return SpooledTemporaryFile(max_size=self.max_memory_size)
+
+    @cached_property
+    def export_metrics(self) -> ExportMetrics:
+        """Durations and figures of the file generation"""
+        return ExportMetrics()
+
+    @cached_property
+    def export_progress(self) -> ExportProgress:
+        """Progression of the file generation, not reported unless replaced"""
+        return ExportProgress()
+
+    def get_export_data_version(self, person: Person, filters: str) -> Optional[str]:
+        """Override it to return a value changing whenever the exported data changes
+        (e.g. the latest modification date), in order to use the result cache."""
+        return None
+
     def get_mimetype(self):
         if self.mimetype is None:
             raise ImproperlyConfigured("Specify mimetype on mixin class")
@@ -59,14 +181,36 @@ class FileExportMixin:
             raise ImproperlyConfigured("Specify file_extension on mixin class")
         return self.file_extension
 
+    def get_export_mimetype(self):
+        """Return the mimetype of the uploaded file"""
+        if self.is_archived():
+            return "application/zip"
+        return self.get_mimetype()
+
+    def get_export_file_extension(self):
+        """Return the extension of the uploaded file"""
+        if self.is_archived():
+            return ".zip"
+        return self.get_file_extension()
+
     def post_export_done(self, person: Person, file_name: str, file_url: str, export_extra_data: Dict) -> None:
+        self.get_export_done_notification(person, file_name, file_url, export_extra_data).save()
+
+    def get_export_done_notification(
+        self,
+        person: Person,
+        file_name: str,
+        file_url: str,
+        export_extra_data: Dict,
+    ) -> WebNotification:
+        """Return the notification of the person once the export is done, not saved yet"""
         payload = format_html(
             "{}: <a href='{}' target='_blank'>{}</a>",
             _("Your document is available here"),
             file_url,
             file_name,
         )
-        WebNotification.objects.create(person=person, payload=payload)
+        return WebNotification(person=person, payload=payload)
 
     def get_read_token_extra_kwargs(self) -> Dict:
         return {}
@@ -81,19 +225,228 @@ class FileExportMixin:
         return {}
 
 
-class ExcelFileExportMixin(FileExportMixin):
-    file_extension = ".xlsx"
-    mimetype = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-    with_legend_worksheet = False
-    with_parameters_worksheet = False
-    description = gettext_lazy('List')
+class ExportColumn(NamedTuple):
+    """Column of a tabular export, made of the value of a field of the exported queryset
+    (related fields included, e.g. 'place__name'), optionally formatted"""
+
+    field: str
+    header: str
+    formatter: Optional[Callable[[Any], Any]] = None
+
+
+class TabularFileExportMixin(FileExportMixin):
+    """File export made of a header and a row for each exported object"""
+
+    # Number of exported objects given at once to get_rows_data
+    export_batch_size = 1000
+    # When set, the values of the columns are read straight from the exported queryset
+    # with values_list(), so neither get_header nor get_row_data have to be implemented
+    export_columns: Optional[List[ExportColumn]] = None
+    # Maximum number of queries per batch of rows, checked when the queries are counted
+    # (see the --check-queries option of the generate_export_file command)
+    export_query_budget: Optional[int] = None
+    # When set, the export is split into files of at most N rows, bundled into a zip archive
+    max_rows_per_file: Optional[int] = None
+    # Field of the exported objects changing whenever their exported data changes (e.g. a
+    # modification date, or the primary key of objects never modified). When set, the rows
+    # are kept in a snapshot, so that the next export with the same filters only queries
+    # and formats the rows of the objects changed since.
+    export_change_tracking_field: Optional[str] = None
+    # How far before the latest value of the change tracking field of the previous export the
+    # objects are read again, as the changes committed late may have an older value. Defaults
+    # to OSIS_EXPORT_SNAPSHOT_LAG for a date field, to none otherwise.
+    export_change_tracking_lag: Any = None
 
     def get_header(self):
-        raise NotImplementedError
+        if self.export_columns is None:
+            raise NotImplementedError
+        return [str(column.header) for column in self.export_columns]
 
     def get_row_data(self, row):
         raise NotImplementedError
 
+    def generate_file(self, person, filters, **kwargs):
+        return self.write_file(self.iter_rows_data(person=person, filters=filters), person=person, filters=filters)
+
+    def write_file(self, rows_data: Iterable[List], person, filters) -> IO[bytes]:
+        """Must return the file made of the header and the given rows"""
+        raise NotImplementedError
+
+    def is_archived(self) -> bool:
+        return super().is_archived() or self.max_rows_per_file is not None
+
+    def generate_export_file(self, person, filters, file_name: str):
+        if self.max_rows_per_file is None:
+            return super().generate_export_file(person=person, filters=filters, file_name=file_name)
+        return self.create_archive(self.iter_file_parts(person=person, filters=filters, file_name=file_name))
+
+    def iter_file_parts(self, person, filters, file_name: str) -> Iterator[Tuple[str, IO[bytes]]]:
+        """Iterate over the names and the files of the parts of the export, of at most
+        max_rows_per_file rows each, generated one after the other"""
+        rows_data = iter(self.iter_rows_data(person=person, filters=filters))
+        end = object()
+        for part in itertools.count(1):
+            first_row = next(rows_data, end)
+            if first_row is end and part > 1:
+                return
+            part_rows_data = (
+                itertools.chain([first_row], itertools.islice(rows_data, self.max_rows_per_file - 1))
+                if first_row is not end
+                else []
+            )
+            yield (
+                "{}-{}{}".format(file_name, part, self.get_file_extension()),
+                self.write_file(part_rows_data, person=person, filters=filters),
+            )
+
+    def get_export_fields(self) -> Optional[List[str]]:
+        """Return the fields of the exported queryset to read, None to read the objects"""
+        if self.export_columns is None:
+            return None
+        return [column.field for column in self.export_columns]
+
+    def get_rows_data(self, batch: List) -> List:
+        """Return the data of each row of the batch. Override it to fetch the data
+        related to the exported objects once per batch, instead of once per row."""
+        if self.export_columns is not None:
+            return self.format_columns(batch)
+        return [self.get_row_data(row) for row in batch]
+
+    def format_columns(self, batch: List[tuple]) -> List:
+        formatters = [column.formatter for column in self.export_columns]
+        if not any(formatters):
+            return [list(values) for values in batch]
+        return [
+            [formatter(value) if formatter else value for formatter, value in zip(formatters, values)]
+            for values in batch
+        ]
+
+    def iter_rows_data(self, person, filters):
+        """Iterate over the data of each exported row"""
+        if self.export_change_tracking_field is not None:
+            yield from self.get_incremental_rows_data(person, filters)
+            return
+        export_objects = self.iter_export_objects(filters=filters, person=person, fields=self.get_export_fields())
+        for batch in self.iter_batches(export_objects):
+            yield from self.format_batch(batch)
+
+    def iter_batches(self, export_objects):
+        """Iterate over the exported objects by batches of export_batch_size"""
+        export_objects = self.export_metrics.measure_iteration(ExportMetrics.QUERY, export_objects)
+        while True:
+            batch = list(itertools.islice(export_objects, self.export_batch_size))
+            if not batch:
+                return
+            yield batch
+
+    def format_batch(self, batch: List) -> List:
+        """Return the data of the rows of the batch, reporting the progression"""
+        metrics = self.export_metrics
+        with metrics.measure(ExportMetrics.FORMATTING):
+            rows_data = self.get_rows_data(batch)
+        metrics.row_count += len(batch)
+        self.export_progress.advance(len(batch))
+        batch_query_count = metrics.end_batch(len(batch))
+        if self.export_query_budget is not None and (batch_query_count or 0) > self.export_query_budget:
+            raise ExportQueryBudgetExceeded(
+                "{} queries executed for {} rows, the budget is {}".format(
+                    batch_query_count,
+                    len(batch),
+                    self.export_query_budget,
+                )
+            )
+        return rows_data
+
+    def get_export_snapshot_key(self, person, filters) -> str:
+        return get_snapshot_key(
+            "{}.{}".format(type(self).__module__, type(self).__qualname__),
+            filters,
+            person.pk if person and self.export_person_specific else None,
+            get_language(),
+            self.get_header(),
+        )
+
+    def get_change_tracking_lag(self, watermark: Any) -> Any:
+        """Return how far before the given watermark the changed objects are read"""
+        if self.export_change_tracking_lag is not None:
+            return self.export_change_tracking_lag
+        if isinstance(watermark, datetime.date):
+            return get_snapshot_lag()
+        return None
+
+    def get_incremental_rows_data(self, person, filters) -> List:
+        """Return the data of each exported row, reusing the rows of the snapshot of the
+        previous export for the objects that did not change since. The rows of the snapshot
+        and of the export are all held in memory while it is generated."""
+        queryset = self.get_export_objects(filters=filters, person=person)
+        if not isinstance(queryset, QuerySet):
+            raise ImproperlyConfigured("Incremental exports require a queryset")
+        if not get_snapshot_root():
+            raise ImproperlyConfigured("Incremental exports require OSIS_EXPORT_SNAPSHOT_ROOT")
+        metrics = self.export_metrics
+        snapshot_key = self.get_export_snapshot_key(person, filters)
+        snapshot = ExportSnapshot.load(snapshot_key)
+
+        with metrics.measure(ExportMetrics.QUERY):
+            # read before the rows, so that the objects changed meanwhile are read again next time
+            watermark = queryset.aggregate(watermark=Max(self.export_change_tracking_field))["watermark"]
+            pks = list(queryset.values_list("pk", flat=True))
+
+        if snapshot is None or snapshot.watermark is None:
+            rows = self.format_objects(queryset)
+        else:
+            rows = snapshot.get_rows_by_pk()
+            since = snapshot.watermark
+            lag = self.get_change_tracking_lag(since)
+            if lag:
+                since -= lag
+            changed = queryset.filter(**{"{}__gte".format(self.export_change_tracking_field): since})
+            rows.update(self.format_objects(changed))
+            # the unchanged objects that were not exported (e.g. matching the filters since)
+            missing_pks = list(dict.fromkeys(pk for pk in pks if pk not in rows))
+            for start in range(0, len(missing_pks), self.export_batch_size):
+                missing = missing_pks[start : start + self.export_batch_size]
+                rows.update(self.format_objects(queryset.filter(pk__in=missing)))
+
+        exported_pks = [pk for pk in pks if pk in rows]
+        rows_data = [rows[pk] for pk in exported_pks]
+        ExportSnapshot(watermark, exported_pks, rows_data).save(snapshot_key)
+        metrics.reused_row_count = max(len(rows_data) - metrics.row_count, 0)
+        metrics.row_count = len(rows_data)
+        self.export_progress.advance(metrics.reused_row_count)
+        return rows_data
+
+    def format_objects(self, queryset: QuerySet) -> Dict:
+        """Return the data of the rows of the given objects, by primary key"""
+        fields = self.get_export_fields()
+        if fields:
+            queryset = queryset.values_list("pk", *fields)
+        rows = {}
+        objects = queryset.iterator(chunk_size=self.export_batch_size) if can_iterate_by_chunks(queryset) else queryset
+        for batch in self.iter_batches(objects):
+            if fields:
+                pks = [values[0] for values in batch]
+                batch = [values[1:] for values in batch]
+            else:
+                pks = [obj.pk for obj in batch]
+            rows.update(zip(pks, self.format_batch(batch)))
+        return rows
+
+
+class ExcelFileExportMixin(TabularFileExportMixin):
+    file_extension = ".xlsx"
+    mimetype = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    with_legend_worksheet = False
+    with_parameters_worksheet = False
+    # When True, the workbook is created in openpyxl write-only mode: rows are
+    # flushed to disk as they are appended, so memory does not grow with the
+    # number of exported rows. Worksheets then only support append(). When None,
+    # it is used unless the view customizes the worksheets or the workbook.
+    write_only: Optional[bool] = None
+    # The rows are split into worksheets of at most N rows, Excel not supporting more
+    max_rows_per_sheet = 1048576 - 1
+    description = gettext_lazy('List')
+
     def customize_legend_worksheet(self, worksheet: Worksheet):
         """Override it to customize the legend worksheet"""
         pass
@@ -120,25 +473,77 @@ class ExcelFileExportMixin(FileExportMixin):
         """Override it to customize the created workbook"""
         pass
 
-    def generate_file(self, person, filters, **kwargs):
-        workbook = Workbook()
+    def is_write_only(self) -> bool:
+        """Return whether the workbook is created in write-only mode"""
+        if self.write_only is not None:
+            return self.write_only
+        # the customized worksheets and workbook may be edited, not only appended to
+        return all(
+            getattr(type(self), hook) is getattr(ExcelFileExportMixin, hook)
+            for hook in ["customize_legend_worksheet", "customize_parameters_worksheet", "customize_workbook_before_save"]
+        )
 
-        # grab the active worksheet
+    def create_worksheet(self, workbook: Workbook, title: str) -> Worksheet:
+        if workbook.write_only:
+            # a write-only workbook has no active worksheet
+            return workbook.create_sheet(title=title)
         worksheet = workbook.active
+        worksheet.title = title
+        return worksheet
+
+    def get_worksheet_title(self, part: int) -> str:
+        """Return the title of the N-th worksheet of the rows, at most 31 characters long"""
+        if part == 1:
+            return str(self.description)[:31]
+        suffix = " ({})".format(part)
+        return str(self.description)[: 31 - len(suffix)] + suffix
+
+    def get_formatted_header(self, worksheet: Worksheet):
+        """Return the header cells, in bold"""
+        cells = []
+        for value in self.get_header():
+            cell = WriteOnlyCell(worksheet, value=value)
+            cell.font = Font(bold=True)
+            cells.append(cell)
+        return cells
+
+    def write_file(self, rows_data, person, filters):
+        workbook = Workbook(write_only=self.is_write_only())
+        try:
+            self.write_worksheets(workbook, rows_data, person, filters)
+        except BaseException:
+            if workbook.write_only:
+                self.discard_worksheets(workbook)
+            raise
 
-        worksheet.title = str(self.description)
-
-        # add headers
-        worksheet.append(self.get_header())
-        cells = worksheet.iter_rows(min_row=1, max_row=1)
-        for col in cells:
-            for cell in col:
-                cell.font = Font(bold=True)
-
-        # add data
-        export_objects = self.get_export_objects(filters=filters, person=person)
-        for export in export_objects:
-            worksheet.append(self.get_row_data(export))
+        # stream back the file
+        tmp = self.create_temporary_file()
+        workbook.save(tmp)
+        tmp.seek(0)
+        return tmp
+
+    @staticmethod
+    def discard_worksheets(workbook: Workbook):
+        """Delete the temporary files of the worksheets of a write-only workbook that is not saved"""
+        for worksheet in workbook.worksheets:
+            if not worksheet.closed and worksheet._writer is not None:
+                worksheet.close()
+                worksheet._writer.cleanup()
+
+    def write_worksheets(self, workbook: Workbook, rows_data, person, filters):
+        # add the data, in as many worksheets as needed, each one with the headers
+        rows_data = iter(rows_data)
+        end = object()
+        for part in itertools.count(1):
+            title = self.get_worksheet_title(part)
+            worksheet = self.create_worksheet(workbook, title) if part == 1 else workbook.create_sheet(title=title)
+            worksheet.append(self.get_formatted_header(worksheet))
+            for row_data in itertools.islice(rows_data, self.max_rows_per_sheet):
+                worksheet.append(row_data)
+            next_row = next(rows_data, end)
+            if next_row is end:
+                break
+            rows_data = itertools.chain([next_row], rows_data)
 
         # add legend
         if self.with_legend_worksheet:
@@ -156,12 +561,188 @@ class ExcelFileExportMixin(FileExportMixin):
 
         self.customize_workbook_before_save(workbook)
 
-        # stream back the file
-        with NamedTemporaryFile() as tmp:
-            workbook.save(tmp.name)
-            tmp.seek(0)
-            return tmp.read()
-
 
 class ExcelFilterSetExportMixin(FilterSetExportMixin, ExcelFileExportMixin):
     """Excel export from a FilterSet based view"""
+
+
+class CsvFileExportMixin(TabularFileExportMixin):
+    file_extension = ".csv"
+    mimetype = "text/csv"
+    csv_delimiter = ","
+    csv_encoding = "utf-8"
+    # When True, the CSV file is compressed with gzip
+    gzip_compression = False
+    # Size of the text buffered before being encoded and written in the file
+    buffer_size = 64 * 1024
+
+    def get_file_extension(self):
+        if self.gzip_compression:
+            return "{}.gz".format(super().get_file_extension())
+        return super().get_file_extension()
+
+    def get_mimetype(self):
+        if self.gzip_compression:
+            return "application/gzip"
+        return super().get_mimetype()
+
+    def write_file(self, rows_data, person, filters):
+        tmp = self.create_temporary_file()
+        output = gzip.GzipFile(fileobj=tmp, mode="wb") if self.gzip_compression else tmp
+
+        # rows are written in a small text buffer, flushed in the file as it fills up
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, delimiter=self.csv_delimiter)
+        writer.writerow(self.get_header())
+        for row_data in rows_data:
+            writer.writerow(row_data)
+            if buffer.tell() >= self.buffer_size:
+                output.write(buffer.getvalue().encode(self.csv_encoding))
+                buffer.seek(0)
+                buffer.truncate()
+        output.write(buffer.getvalue().encode(self.csv_encoding))
+        if self.gzip_compression:
+            output.close()
+
+        # stream back the file
+        tmp.seek(0)
+        return tmp
+
+
+class CsvFilterSetExportMixin(FilterSetExportMixin, CsvFileExportMixin):
+    """CSV export from a FilterSet based view"""
+
+
+def get_parquet_field_type(model, field_path: str):
+    """Return the pyarrow type of the values of the given field of the model (related fields
+    included, e.g. 'place__name'), None if unknown"""
+    import pyarrow
+
+    field = None
+    try:
+        for name in field_path.split("__"):
+            if field is not None:
+                if not field.is_relation or field.related_model is None:
+                    return None
+                model = field.related_model
+            field = model._meta.pk if name == "pk" else model._meta.get_field(name)
+    except FieldDoesNotExist:
+        # e.g. an annotation or a transform
+        return None
+    # the value of a foreign key is the one of the field it refers to
+    while field.many_to_one or (field.one_to_one and field.concrete):
+        field = field.target_field
+    if field.is_relation:
+        return None
+    internal_type = field.get_internal_type()
+    if internal_type == "DecimalField":
+        return pyarrow.decimal128(field.max_digits, field.decimal_places) if field.max_digits <= 38 else None
+    if internal_type == "DateTimeField":
+        return pyarrow.timestamp("us", tz="UTC" if settings.USE_TZ else None)
+    return {
+        "AutoField": pyarrow.int64(),
+        "BigAutoField": pyarrow.int64(),
+        "SmallAutoField": pyarrow.int64(),
+        "IntegerField": pyarrow.int64(),
+        "BigIntegerField": pyarrow.int64(),
+        "SmallIntegerField": pyarrow.int64(),
+        "PositiveIntegerField": pyarrow.int64(),
+        "PositiveBigIntegerField": pyarrow.int64(),
+        "PositiveSmallIntegerField": pyarrow.int64(),
+        "BooleanField": pyarrow.bool_(),
+        "NullBooleanField": pyarrow.bool_(),
+        "FloatField": pyarrow.float64(),
+        "CharField": pyarrow.string(),
+        "TextField": pyarrow.string(),
+        "SlugField": pyarrow.string(),
+        "DateField": pyarrow.date32(),
+        "TimeField": pyarrow.time64("us"),
+        "DurationField": pyarrow.duration("us"),
+    }.get(internal_type)
+
+
+class ParquetFileExportMixin(TabularFileExportMixin):
+    """Columnar export in the Apache Parquet format, requiring pyarrow"""
+
+    file_extension = ".parquet"
+    mimetype = "application/vnd.apache.parquet"
+    # Each batch of rows is written as a row group, larger ones compress better
+    export_batch_size = 10000
+    # Compression codec of the columns (e.g. 'snappy', 'gzip', 'zstd' or None)
+    parquet_compression = "snappy"
+
+    def get_parquet_schema(self, rows_data: List[List], person=None, filters=None):
+        """Return the pyarrow schema of the file. The type of each column is the one of
+        its model field (for the export_columns without formatter), or else inferred from
+        the first batch of rows, a column without any value being a string one. Override
+        it when the type of a column can not be inferred from it."""
+        import pyarrow
+
+        header = self.get_header()
+        column_types = self.get_parquet_column_types(person, filters) or [None] * len(header)
+        fields = []
+        for name, values, data_type in zip(header, list(zip(*rows_data)) or [()] * len(header), column_types):
+            if data_type is None:
+                data_type = pyarrow.array(values).type
+            # the type of an empty column is unknown
+            fields.append(pyarrow.field(str(name), pyarrow.string() if pyarrow.types.is_null(data_type) else data_type))
+        return pyarrow.schema(fields)
+
+    def get_parquet_column_types(self, person, filters) -> Optional[List]:
+        """Return the pyarrow type of the model field of each column (None if unknown),
+        None if the columns are not read from a queryset"""
+        if self.export_columns is None:
+            return None
+        queryset = self.get_export_objects(filters=filters, person=person)
+        if not isinstance(queryset, QuerySet):
+            return None
+        return [
+            None if column.formatter else get_parquet_field_type(queryset.model, column.field)
+            for column in self.export_columns
+        ]
+
+    @staticmethod
+    def get_parquet_batch(rows_data: List[List], schema):
+        """Return the rows as a pyarrow record batch of the given schema. The values are
+        converted safely, a value that does not fit the type of its column fails the export
+        instead of being truncated."""
+        import pyarrow
+
+        arrays = []
+        for values, field in zip(zip(*rows_data), schema):
+            try:
+                array = pyarrow.array(values)
+                if array.type != field.type:
+                    array = array.cast(field.type, safe=True)
+            except (pyarrow.ArrowInvalid, pyarrow.ArrowTypeError, pyarrow.ArrowNotImplementedError) as e:
+                raise ImproperlyConfigured(
+                    "The values of the '{}' column do not fit its {} type, override get_parquet_schema".format(
+                        field.name,
+                        field.type,
+                    )
+                ) from e
+            arrays.append(array)
+        return pyarrow.RecordBatch.from_arrays(arrays, schema=schema)
+
+    def write_file(self, rows_data, person, filters):
+        try:
+            from pyarrow import parquet
+        except ImportError:
+            raise ImproperlyConfigured("Parquet exports require pyarrow")
+
+        tmp = self.create_temporary_file()
+        rows = iter(rows_data)
+        rows_data = list(itertools.islice(rows, self.export_batch_size))
+        schema = self.get_parquet_schema(rows_data, person=person, filters=filters)
+        with parquet.ParquetWriter(tmp, schema, compression=self.parquet_compression) as writer:
+            while rows_data:
+                writer.write_batch(self.get_parquet_batch(rows_data, schema))
+                rows_data = list(itertools.islice(rows, self.export_batch_size))
+
+        # stream back the file
+        tmp.seek(0)
+        return tmp
+
+
+class ParquetFilterSetExportMixin(FilterSetExportMixin, ParquetFileExportMixin):
+    """Parquet export from a FilterSet based view"""
@@ -0,0 +1,126 @@
+import time
+import tracemalloc
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from django.db import connection
+
+
+class ExportQueryBudgetExceeded(Exception):
+    """Raised when a batch of rows executes more queries than allowed by the view"""
+
+
+class ExportMetrics:
+    """Collect the duration of each phase of an export generation, and its figures"""
+
+    QUERY = "query"
+    FORMATTING = "formatting"
+    GENERATION = "generation"
+    SERIALIZATION = "serialization"
+    UPLOAD = "upload"
+    TOKEN = "token"
+    NOTIFICATION = "notification"
+
+    def __init__(self):
+        self.durations = defaultdict(float)
+        self.row_count = 0
+        # only set for incremental exports, the rows reused from the previous export
+        self.reused_row_count = None
+        self.output_bytes = None
+        # only counted inside count_queries()
+        self.query_count = None
+        self.batch_query_counts: List[Tuple[int, int]] = []
+        self._batch_start_query_count = 0
+        # only measured inside trace_memory()
+        self.peak_memory_kb = None
+
+    @contextmanager
+    def measure(self, phase: str):
+        """Add the time spent in the block to the duration of the given phase"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.durations[phase] += time.perf_counter() - start
+
+    def measure_iteration(self, phase: str, iterable: Iterable) -> Iterator:
+        """Iterate over the given iterable, adding the time spent to get each item to
+        the duration of the given phase"""
+        iterator = iter(iterable)
+        while True:
+            with self.measure(phase):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    @contextmanager
+    def count_queries(self):
+        """Count the database queries executed in the block, per batch of rows"""
+        self.query_count = 0
+        self._batch_start_query_count = 0
+        with connection.execute_wrapper(self._count_query):
+            yield
+
+    def _count_query(self, execute, sql, params, many, context):
+        self.query_count += 1
+        return execute(sql, params, many, context)
+
+    def end_batch(self, row_count: int) -> Optional[int]:
+        """Returns the number of queries executed for the batch of rows that ended, if counted"""
+        if self.query_count is None:
+            return None
+        batch_query_count = self.query_count - self._batch_start_query_count
+        self.batch_query_counts.append((row_count, batch_query_count))
+        self._batch_start_query_count = self.query_count
+        return batch_query_count
+
+    def has_n_plus_one_queries(self, min_row_count: int = 10) -> bool:
+        """Whether a batch of rows executed at least one query per row, i.e. the number of
+        queries grows with the number of rows"""
+        return any(
+            query_count >= row_count >= min_row_count for row_count, query_count in self.batch_query_counts
+        )
+
+    @contextmanager
+    def trace_memory(self):
+        """Measure the peak of the memory allocated by Python in the block, in kilobytes,
+        not counting the memory allocated before (tracing the allocations is slower)"""
+        started = not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start()
+        else:
+            tracemalloc.reset_peak()
+        start_memory = tracemalloc.get_traced_memory()[0]
+        try:
+            yield
+        finally:
+            self.peak_memory_kb = max(tracemalloc.get_traced_memory()[1] - start_memory, 0) // 1024
+            if started:
+                tracemalloc.stop()
+
+    def as_dict(self) -> Dict:
+        durations = dict(self.durations)
+        generation = durations.pop(self.GENERATION, None)
+        if generation is not None:
+            # the time spent generating the file, but neither querying nor formatting the rows
+            durations[self.SERIALIZATION] = max(
+                generation - durations.get(self.QUERY, 0) - durations.get(self.FORMATTING, 0),
+                0,
+            )
+        metrics = {
+            "durations": {phase: round(duration, 3) for phase, duration in durations.items()},
+            "row_count": self.row_count,
+            "output_bytes": self.output_bytes,
+        }
+        if self.reused_row_count is not None:
+            metrics["reused_row_count"] = self.reused_row_count
+        if self.peak_memory_kb is not None:
+            metrics["peak_memory_kb"] = self.peak_memory_kb
+        if self.query_count is not None:
+            metrics["query_count"] = self.query_count
+            metrics["batch_query_counts"] = self.batch_query_counts
+            metrics["n_plus_one_queries"] = self.has_n_plus_one_queries()
+        return metrics
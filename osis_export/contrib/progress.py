@@ -0,0 +1,39 @@
+import time
+from typing import Callable, Optional
+
+
+class ExportProgress:
+    """Report the progression of an export generation to the given callback, as a
+    percentage of the total number of rows. To limit the number of updates, it is
+    reported at most every `every_rows` rows and every `interval` seconds."""
+
+    def __init__(
+        self,
+        total: Optional[int] = None,
+        callback: Callable[[int], None] = None,
+        every_rows: int = 1000,
+        interval: float = 5,
+    ):
+        self.total = total
+        self.callback = callback
+        self.every_rows = every_rows
+        self.interval = interval
+        self.count = 0
+        self.progression = None
+        self._last_reported_count = 0
+        self._last_reported_at = time.monotonic()
+
+    def advance(self, rows: int = 1) -> None:
+        self.count += rows
+        if not self.callback or not self.total or self.count - self._last_reported_count < self.every_rows:
+            return
+        now = time.monotonic()
+        if now - self._last_reported_at < self.interval:
+            return
+        self._last_reported_count = self.count
+        self._last_reported_at = now
+        # keep 1 and 100 for the start and the end of the generation
+        progression = min(1 + 98 * self.count // self.total, 99)
+        if progression != self.progression:
+            self.progression = progression
+            self.callback(progression)
@@ -0,0 +1,30 @@
+from functools import lru_cache
+from typing import Type
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from osis_export.contrib.export_mixins import ExportMixin, FileExportMixin
+
+# The class paths may come from the requests, keep a bounded number of them
+REGISTRY_SIZE = 256
+
+
+@lru_cache(maxsize=REGISTRY_SIZE)
+def get_class(path: str) -> Type:
+    """Import the class with the given dotted path once per process, raises ImportError
+    if it does not exist (not memoized)"""
+    return import_string(path)
+
+
+def get_async_manager_class() -> Type:
+    """Returns the asynchronous manager class set in the settings"""
+    return get_class(settings.OSIS_EXPORT_ASYNCHRONOUS_MANAGER_CLS)
+
+
+@lru_cache(maxsize=REGISTRY_SIZE)
+def is_export_class(path: str) -> bool:
+    """Whether the class with the given dotted path is an export class, raises ImportError
+    if it does not exist (not memoized)"""
+    cls = get_class(path)
+    return isinstance(cls, type) and issubclass(cls, (ExportMixin, FileExportMixin))
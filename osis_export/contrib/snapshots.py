@@ -0,0 +1,151 @@
+import datetime
+import decimal
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+from django.conf import settings
+from django.http import QueryDict
+from django.utils.functional import Promise
+
+# key of the JSON objects encoding a value JSON does not support
+TYPE_KEY = "__type__"
+
+DECODERS = {
+    "datetime": datetime.datetime.fromisoformat,
+    "date": datetime.date.fromisoformat,
+    "time": datetime.time.fromisoformat,
+    "decimal": decimal.Decimal,
+    "uuid": uuid.UUID,
+}
+
+
+def get_snapshot_root() -> Optional[str]:
+    """Returns the directory in which the snapshots of the incremental exports are stored"""
+    return getattr(settings, "OSIS_EXPORT_SNAPSHOT_ROOT", None)
+
+
+def get_snapshot_max_age() -> datetime.timedelta:
+    """Returns how long the snapshot of an incremental export is reused"""
+    return getattr(settings, "OSIS_EXPORT_SNAPSHOT_MAX_AGE", datetime.timedelta(days=7))
+
+
+def get_snapshot_lag() -> datetime.timedelta:
+    """Returns how far before the watermark of a snapshot the objects are read again, when
+    it is a date, so that the changes committed late with an older date are not missed"""
+    return getattr(settings, "OSIS_EXPORT_SNAPSHOT_LAG", datetime.timedelta(minutes=5))
+
+
+def get_snapshot_key(called_from_class: str, filters: str, person_id: Optional[int], language: str, header) -> str:
+    """Returns a hash identifying the rows of an export, the same for each run of the export"""
+    content = [called_from_class, sorted(QueryDict(filters).lists()), person_id, language, [str(h) for h in header]]
+    return hashlib.sha256(json.dumps(content).encode()).hexdigest()
+
+
+def delete_expired_snapshots() -> int:
+    """Delete the snapshots older than their maximum age, returns how many were deleted"""
+    root = get_snapshot_root()
+    if not root or not os.path.isdir(root):
+        return 0
+    deleted = 0
+    max_age = get_snapshot_max_age().total_seconds()
+    for entry in os.scandir(root):
+        try:
+            if entry.is_file() and time.time() - entry.stat().st_mtime > max_age:
+                os.remove(entry.path)
+                deleted += 1
+        except FileNotFoundError:
+            # deleted meanwhile
+            pass
+    return deleted
+
+
+class SnapshotEncoder(json.JSONEncoder):
+    """Encode the values JSON does not support with their type, to decode them back as is"""
+
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return {TYPE_KEY: "datetime", "value": o.isoformat()}
+        if isinstance(o, datetime.date):
+            return {TYPE_KEY: "date", "value": o.isoformat()}
+        if isinstance(o, datetime.time):
+            return {TYPE_KEY: "time", "value": o.isoformat()}
+        if isinstance(o, decimal.Decimal):
+            return {TYPE_KEY: "decimal", "value": str(o)}
+        if isinstance(o, uuid.UUID):
+            return {TYPE_KEY: "uuid", "value": str(o)}
+        if isinstance(o, Promise):
+            # lazy translations, already translated in the language of the export
+            return str(o)
+        return super().default(o)
+
+
+def decode_value(content: Dict) -> Any:
+    if TYPE_KEY in content:
+        return DECODERS[content[TYPE_KEY]](content["value"])
+    return content
+
+
+class ExportSnapshot:
+    """Formatted rows of an incremental export, with the primary keys of their objects and the
+    latest value of the change tracking field when they were read. Stored as gzipped JSON lines,
+    the first one with the watermark, then one per row, so that reading it never runs any code."""
+
+    def __init__(self, watermark: Any, pks: List, rows: List[List]):
+        self.watermark = watermark
+        self.pks = pks
+        self.rows = rows
+
+    @staticmethod
+    def get_path(key: str) -> str:
+        return os.path.join(get_snapshot_root(), "{}.jsonl.gz".format(key))
+
+    @classmethod
+    def load(cls, key: str) -> Optional["ExportSnapshot"]:
+        """Returns the snapshot stored with the given key, None if missing, too old or not
+        written by the current user"""
+        path = cls.get_path(key)
+        pks, rows = [], []
+        try:
+            stat = os.stat(path)
+            if hasattr(os, "getuid") and stat.st_uid != os.getuid():
+                return None
+            if time.time() - stat.st_mtime > get_snapshot_max_age().total_seconds():
+                return None
+            with gzip.open(path, "rt", encoding="utf-8") as file:
+                watermark = json.loads(next(file), object_hook=decode_value)["watermark"]
+                for line in file:
+                    pk, row = json.loads(line, object_hook=decode_value)
+                    pks.append(pk)
+                    rows.append(row)
+        except (OSError, EOFError, StopIteration, ValueError, KeyError, TypeError):
+            return None
+        return cls(watermark, pks, rows)
+
+    def save(self, key: str) -> None:
+        root = get_snapshot_root()
+        os.makedirs(root, mode=0o700, exist_ok=True)
+        # write it aside first, so that a concurrent export never reads a partial snapshot
+        fd, tmp_path = tempfile.mkstemp(dir=root)
+        encoder = SnapshotEncoder(ensure_ascii=False)
+        try:
+            with os.fdopen(fd, "wb") as tmp, gzip.open(tmp, "wt", encoding="utf-8") as file:
+                file.write(encoder.encode({"watermark": self.watermark}) + "\n")
+                for pk, row in zip(self.pks, self.rows):
+                    file.write(encoder.encode([pk, list(row)]) + "\n")
+        except (TypeError, ValueError):
+            # a value can not be stored, the rows are all read again next time
+            os.remove(tmp_path)
+            return
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        os.replace(tmp_path, self.get_path(key))
+
+    def get_rows_by_pk(self) -> Dict:
+        return dict(zip(self.pks, self.rows))
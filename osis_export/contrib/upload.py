@@ -0,0 +1,100 @@
+import io
+import logging
+import time
+import uuid
+from typing import IO, Iterator, Union
+
+import requests
+from django.conf import settings
+
+from osis_document.utils import save_raw_content_remotely
+
+# request timeout and too many requests, the upload may succeed later
+RETRYABLE_CLIENT_ERRORS = (408, 429)
+
+
+class RemoteUploadError(Exception):
+    """Raised when the generated file can not be uploaded to OSIS Document"""
+
+
+class RemoteUploadUnavailable(RemoteUploadError):
+    """Raised when OSIS Document can not be reached, the upload may succeed later"""
+
+
+class MultipartFileBody:
+    """multipart/form-data body made of a single file, iterated over in chunks read from
+    the file, so that the file content is never entirely loaded in memory"""
+
+    def __init__(self, file: IO[bytes], field_name: str, file_name: str, mimetype: str, chunk_size: int):
+        self.file = file
+        self.chunk_size = chunk_size
+        boundary = uuid.uuid4().hex
+        self.content_type = "multipart/form-data; boundary={}".format(boundary)
+        self.prefix = (
+            '--{boundary}\r\n'
+            'Content-Disposition: form-data; name="{field_name}"; filename="{file_name}"\r\n'
+            'Content-Type: {mimetype}\r\n'
+            '\r\n'
+        ).format(
+            boundary=boundary,
+            field_name=field_name,
+            file_name=file_name.replace('"', "%22"),
+            mimetype=mimetype,
+        ).encode()
+        self.suffix = "\r\n--{}--\r\n".format(boundary).encode()
+        self.file_size = file.seek(0, io.SEEK_END)
+
+    def __len__(self):
+        return len(self.prefix) + self.file_size + len(self.suffix)
+
+    def __iter__(self) -> Iterator[bytes]:
+        # always start from the beginning of the file, the upload may be retried
+        self.file.seek(0)
+        yield self.prefix
+        while True:
+            chunk = self.file.read(self.chunk_size)
+            if not chunk:
+                break
+            yield chunk
+        yield self.suffix
+
+
+def save_file_remotely(file: Union[bytes, IO[bytes]], file_name: str, mimetype: str) -> str:
+    """Upload the generated file to OSIS Document and return its token. A file object is
+    streamed by chunks of OSIS_EXPORT_UPLOAD_CHUNK_SIZE bytes, and the upload is retried
+    up to OSIS_EXPORT_UPLOAD_RETRIES times if OSIS Document can not be reached."""
+    if isinstance(file, bytes):
+        return save_raw_content_remotely(file, file_name, mimetype)
+
+    body = MultipartFileBody(
+        file,
+        field_name="file",
+        file_name=file_name,
+        mimetype=mimetype,
+        chunk_size=getattr(settings, "OSIS_EXPORT_UPLOAD_CHUNK_SIZE", 1024 * 1024),
+    )
+    retries = getattr(settings, "OSIS_EXPORT_UPLOAD_RETRIES", 3)
+    for attempt in range(retries + 1):
+        try:
+            response = requests.post(
+                "{}request-upload".format(settings.OSIS_DOCUMENT_BASE_URL),
+                data=body,
+                headers={
+                    "Content-Type": body.content_type,
+                    "X-Api-Key": settings.OSIS_DOCUMENT_API_SHARED_SECRET,
+                },
+                timeout=getattr(settings, "OSIS_EXPORT_UPLOAD_TIMEOUT", 300),
+            )
+        except (requests.ConnectionError, requests.Timeout) as e:
+            error = e
+        else:
+            if response.status_code < 400:
+                return response.json().get("token")
+            error = RemoteUploadError("Upload failed with status {}".format(response.status_code))
+            if response.status_code < 500 and response.status_code not in RETRYABLE_CLIENT_ERRORS:
+                # the upload itself is invalid, retrying will not help
+                raise error
+        if attempt < retries:
+            logging.getLogger(settings.DEFAULT_LOGGER).warning("Retrying the upload of %s: %s", file_name, error)
+            time.sleep(2 ** attempt)
+    raise RemoteUploadUnavailable("Upload of {} failed after {} attempts".format(file_name, retries + 1)) from error
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from osis_export.contrib.snapshots import delete_expired_snapshots
+from osis_export.models import Export
+
+
+class Command(BaseCommand):
+    help = "Delete the expired exports and snapshots"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of exports deleted per transaction",
+        )
+
+    def handle(self, *args, **options):
+        deleted_exports = 0
+        while True:
+            # a bounded number of rows is locked at once
+            with transaction.atomic():
+                export_ids = list(Export.objects.expired().values_list("pk", flat=True)[: options["batch_size"]])
+                if not export_ids:
+                    break
+                deleted_exports += Export.objects.filter(pk__in=export_ids).delete()[0]
+        deleted_snapshots = delete_expired_snapshots()
+        self.stdout.write(
+            "Deleted {} expired export(s) and {} expired snapshot(s)".format(deleted_exports, deleted_snapshots)
+        )
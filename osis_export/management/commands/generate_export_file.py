@@ -1,83 +1,338 @@
+import io
 import logging
+from contextlib import closing, nullcontext
 
+import requests
 from django.conf import settings
 from django.core.management.base import BaseCommand
+from django.db import InterfaceError, OperationalError
 from django.utils import timezone, translation
-from django.utils.module_loading import import_string
 from django.utils.translation import gettext as _
 from osis_async.models.enums import TaskState
 from osis_document.api.utils import get_remote_token
-from osis_document.utils import save_raw_content_remotely, get_file_url
+from osis_document.utils import get_file_url
+from osis_export.contrib.export_mixins import FileExportMixin
+from osis_export.contrib.metrics import ExportMetrics
+from osis_export.contrib.progress import ExportProgress
+from osis_export.contrib.registry import get_async_manager_class, get_class
+from osis_export.contrib.upload import RemoteUploadUnavailable, save_file_remotely
 from osis_export.models import Export
+from osis_export.models.export import ExportLeaseLost
+from osis_export.signals import export_generated
 
 
 class Command(BaseCommand):
     help = "Generate all the export files"
+    check_queries = False
+    trace_memory = False
+    # the range of costs of the exports generated by this run
+    min_cost = None
+    max_cost = None
+    # The generation is attempted again later on these errors, other ones fail the export at once
+    transient_errors = (
+        OperationalError,
+        InterfaceError,
+        RemoteUploadUnavailable,
+        requests.ConnectionError,
+        requests.Timeout,
+    )
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # the final updates of the async tasks and the notifications, sent at once per batch
+        self.task_updates = []
+        self.notifications = []
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--export",
+            action="append",
+            type=int,
+            default=[],
+            help="Only generate the pending export with this id (can be repeated)",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1,
+            help="Number of pending exports claimed at once",
+        )
+        parser.add_argument(
+            "--min-cost",
+            type=int,
+            help="Only generate the pending exports estimated to cost at least this much",
+        )
+        parser.add_argument(
+            "--max-cost",
+            type=int,
+            help="Only generate the pending exports estimated to cost less than this (or of unknown cost)",
+        )
+        parser.add_argument(
+            "--check-queries",
+            action="store_true",
+            help="Count the queries per batch of rows, warn about N+1 queries and enforce the views query budget",
+        )
+        parser.add_argument(
+            "--trace-memory",
+            action="store_true",
+            help="Measure the peak memory allocated by the generation of each export (slower)",
+        )
 
     def handle(self, *args, **options):
-        for export in Export.objects.not_generated():
-            job_uuid = export.job_uuid
-            language = export.person.language or settings.LANGUAGE_CODE
-            export_extra_data = export.extra_data or {}
-
-            # Update the related async task first
-            task_manager = import_string(settings.OSIS_EXPORT_ASYNCHRONOUS_MANAGER_CLS)
-            # Import and instantiate the base view class
-            base_class_instance = import_string(export.called_from_class)()
-
-            task_manager.update(
-                job_uuid,
-                progression=1,
-                state=TaskState.PROCESSING,
-                started_at=timezone.now(),
-                **base_class_instance.get_task_started_async_manager_extra_kwargs()
-            )
-            # Generate the file and the notification in the person's language
-            with translation.override(language):
-                # generate the wanted file by calling the method on mixin
+        self.check_queries = options["check_queries"]
+        self.trace_memory = options["trace_memory"]
+        self.min_cost = options["min_cost"]
+        self.max_cost = options["max_cost"]
+
+        try:
+            while True:
+                exports = Export.objects.claim(
+                    limit=options["batch_size"],
+                    export_ids=options["export"],
+                    min_cost=self.min_cost,
+                    max_cost=self.max_cost,
+                )
+                if not exports:
+                    break
+                for export in exports:
+                    try:
+                        self.generate(export)
+                    except Exception as e:
+                        # do not delay the other exports, this one is claimed again once its lease expired
+                        logging.getLogger(settings.DEFAULT_LOGGER).exception(e)
                 try:
-                    file = base_class_instance.generate_file(
-                        person=export.person,
-                        filters=export.filters,
-                    )
+                    self.flush()
+                except Exception as e:
+                    # the updates are sent again with the ones of the next batch
+                    logging.getLogger(settings.DEFAULT_LOGGER).exception(e)
+        finally:
+            # the updates left, e.g. if interrupted
+            self.flush()
+
+    def flush(self):
+        """Send the pending updates of the async tasks and notifications, each list being
+        kept until it was sent, so that a failure does not lose them"""
+        task_manager = get_async_manager_class()
+        if self.task_updates:
+            task_manager.bulk_update(self.task_updates)
+            self.task_updates = []
+        if self.notifications:
+            task_manager.bulk_create_notifications(self.notifications)
+            self.notifications = []
+
+    def generate(self, export):
+        # keep the export for this run, even if previous ones of the batch were long
+        if not export.renew_lease():
+            logging.getLogger(settings.DEFAULT_LOGGER).warning("Lost the lease of export %s", export.pk)
+            return
+        # estimated once claimed, so that the rows of an export are counted by a single run; a new
+        # export found too large for this run is left to the runs generating the largest exports
+        export.estimate_cost()
+        if not export.is_within_cost_range(self.min_cost, self.max_cost):
+            export.release_lease()
+            return
+        # the identical exports requested in the meantime get the same file
+        exports = [export]
+        if export.request_fingerprint:
+            exports += Export.objects.claim(request_fingerprint=export.request_fingerprint)
+
+        language = export.get_language()
+
+        # Update the related async task first
+        task_manager = get_async_manager_class()
+        base_class_instance = None
+        # Generate the file and the notification in the person's language
+        with translation.override(language):
+            # any failure from here is retried later or fails the export at once
+            try:
+                # Import and instantiate the base view class
+                base_class_instance = get_class(export.called_from_class)()
+                metrics = base_class_instance.export_metrics
+
+                def report_progress(progression):
+                    # the export is still being generated, keep it, unless another generation claimed it
+                    if not export.renew_lease():
+                        raise ExportLeaseLost("Lost the lease of export {}".format(export.pk))
+                    task_manager.bulk_update([(exp.job_uuid, {"progression": progression}) for exp in exports])
+
+                base_class_instance.export_progress = ExportProgress(
+                    total=export.estimate_cost(),
+                    callback=report_progress,
+                    every_rows=base_class_instance.export_progress_every_rows,
+                    interval=base_class_instance.export_progress_interval,
+                )
+
+                started_kwargs = dict(
+                    progression=1,
+                    state=TaskState.PROCESSING,
+                    started_at=timezone.now(),
+                    **base_class_instance.get_task_started_async_manager_extra_kwargs()
+                )
+                task_manager.bulk_update([(exp.job_uuid, started_kwargs) for exp in exports])
 
-                    # save file into an Upload object in order to reuse osis_document
-                    file_extension = base_class_instance.get_file_extension()
-                    file_mimetype = base_class_instance.get_mimetype()
-                    file_name = "{}{}".format(export.file_name, file_extension)
-                    token = save_raw_content_remotely(file, file_name, file_mimetype)
+                # generate the wanted file by calling the method on mixin
+                file_extension = base_class_instance.get_export_file_extension()
+                file_mimetype = base_class_instance.get_export_mimetype()
+                file_name = "{}{}".format(export.file_name, file_extension)
+
+                result_fingerprint = self.get_result_fingerprint(export, base_class_instance, language)
+                cached_export = result_fingerprint and Export.objects.cached_result(result_fingerprint)
+                if cached_export:
+                    # reuse the file of the identical export, which stays the only
+                    # one cached so that the file is never reused after its expiration
+                    export.file = cached_export.file
+                else:
+                    with metrics.measure(ExportMetrics.GENERATION):
+                        with self.count_queries(metrics), self.measure_memory(metrics):
+                            file = base_class_instance.generate_export_file(
+                                person=export.person,
+                                filters=export.filters,
+                                file_name=export.file_name,
+                            )
+                    if metrics.has_n_plus_one_queries():
+                        logging.getLogger(settings.DEFAULT_LOGGER).warning(
+                            "Export %s executes at least one query per row (%s)",
+                            export.called_from_class,
+                            metrics.batch_query_counts,
+                        )
+                    metrics.output_bytes = self.get_file_size(file)
+
+                    # save file into an Upload object in order to reuse osis_document,
+                    # streaming it from the file, not from a copy of its content
+                    with metrics.measure(ExportMetrics.UPLOAD), self.closing(file):
+                        token = save_file_remotely(file, file_name, file_mimetype)
                     export.file = [token]
-                    export.save()
+                    export.result_fingerprint = result_fingerprint
+                export.generated_at = timezone.now()
+                export.save()
+                for duplicate in exports[1:]:
+                    duplicate.file = export.file
+                    duplicate.generated_at = export.generated_at
+                    duplicate.save()
+                with metrics.measure(ExportMetrics.TOKEN):
                     read_token = get_remote_token(
                         uuid=export.file[0],
                         **base_class_instance.get_read_token_extra_kwargs(),
                     )
                     file_url = get_file_url(read_token)
-                except Exception as e:
-                    task_manager.update(
-                        job_uuid,
-                        progression=0,
-                        state=TaskState.ERROR,
-                        **base_class_instance.get_task_error_async_manager_extra_kwargs(e)
-                    )
-                    logging.getLogger(settings.DEFAULT_LOGGER).error(e)
-                    raise e
-
-                # and finally update the related async task again
-                task_manager.update(
-                    job_uuid,
-                    progression=100,
-                    state=TaskState.DONE,
-                    completed_at=timezone.now(),
-                    **base_class_instance.get_task_done_async_manager_extra_kwargs(
-                        file_name,
-                        file_url,
-                        export_extra_data,
-                    )
+
+                # the default notification can be saved with the other ones, not a custom one
+                default_post_export_done = (
+                    type(base_class_instance).post_export_done is FileExportMixin.post_export_done
                 )
-                base_class_instance.post_export_done(
-                    export.person,
-                    file_name,
-                    file_url,
-                    export_extra_data,
+                # only sent once all the exports are done, not to set a failed one done
+                task_updates, notifications = [], []
+                for exp in exports:
+                    export_extra_data = exp.extra_data or {}
+                    # and finally update the related async task again
+                    task_updates.append(
+                        (
+                            exp.job_uuid,
+                            dict(
+                                progression=100,
+                                state=TaskState.DONE,
+                                completed_at=timezone.now(),
+                                **base_class_instance.get_task_done_async_manager_extra_kwargs(
+                                    file_name,
+                                    file_url,
+                                    export_extra_data,
+                                )
+                            ),
+                        )
+                    )
+                    if default_post_export_done:
+                        # saved with the notifications of the whole batch, once the metrics are recorded
+                        notifications.append(
+                            base_class_instance.get_export_done_notification(
+                                exp.person,
+                                file_name,
+                                file_url,
+                                export_extra_data,
+                            )
+                        )
+                    else:
+                        with metrics.measure(ExportMetrics.NOTIFICATION):
+                            base_class_instance.post_export_done(
+                                exp.person,
+                                file_name,
+                                file_url,
+                                export_extra_data,
+                            )
+                self.task_updates += task_updates
+                self.notifications += notifications
+            except ExportLeaseLost as e:
+                logging.getLogger(settings.DEFAULT_LOGGER).warning(e)
+                # the export is left to the generation that claimed it, not its duplicates
+                for exp in exports[1:]:
+                    self.task_updates.append((exp.job_uuid, dict(progression=0, state=TaskState.PENDING)))
+                return
+            except Exception as e:
+                logging.getLogger(settings.DEFAULT_LOGGER).exception(e)
+                for exp in exports:
+                    self.record_failure(exp, e, base_class_instance)
+                return
+
+        export.metrics = metrics.as_dict()
+        Export.objects.filter(pk=export.pk).update(metrics=export.metrics)
+        for receiver, response in export_generated.send_robust(sender=Export, export=export, metrics=export.metrics):
+            if isinstance(response, Exception):
+                logging.getLogger(settings.DEFAULT_LOGGER).error(
+                    "Error in the %s receiver of export_generated: %r",
+                    receiver,
+                    response,
                 )
+
+    def record_failure(self, export, error, base_class_instance):
+        """Retry the export later on transient errors, fail it otherwise"""
+        try:
+            if isinstance(error, self.transient_errors) and export.can_be_retried():
+                export.schedule_retry(error)
+                self.task_updates.append((export.job_uuid, dict(progression=0, state=TaskState.PENDING)))
+                return
+            export.mark_failed(error)
+            # the view itself may be missing
+            error_kwargs = (
+                base_class_instance.get_task_error_async_manager_extra_kwargs(error)
+                if base_class_instance is not None
+                else {}
+            )
+        except Exception as e:
+            # e.g. the database is unavailable, the export is claimed again once its lease expired
+            logging.getLogger(settings.DEFAULT_LOGGER).exception(e)
+            return
+        self.task_updates.append((export.job_uuid, dict(progression=0, state=TaskState.ERROR, **error_kwargs)))
+
+    @staticmethod
+    def get_file_size(file) -> int:
+        if isinstance(file, bytes):
+            return len(file)
+        size = file.seek(0, io.SEEK_END)
+        file.seek(0)
+        return size
+
+    @staticmethod
+    def closing(file):
+        """Close the generated file (and delete it, if temporary) once used"""
+        if isinstance(file, bytes):
+            return nullcontext()
+        return closing(file)
+
+    def count_queries(self, metrics):
+        if self.check_queries:
+            return metrics.count_queries()
+        return nullcontext()
+
+    def measure_memory(self, metrics):
+        if self.trace_memory:
+            return metrics.trace_memory()
+        return nullcontext()
+
+    @staticmethod
+    def get_result_fingerprint(export, base_class_instance, language) -> str:
+        """Returns the fingerprint of the export result if it can be cached, an empty string otherwise"""
+        if not base_class_instance.export_result_cache:
+            return ""
+        data_version = base_class_instance.get_export_data_version(person=export.person, filters=export.filters)
+        if data_version is None:
+            return ""
+        return export.get_result_fingerprint(language, data_version, base_class_instance.export_person_specific)
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.20 on 2026-10-18 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('osis_export', '0002_export_extra_data'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='export',
+            name='leased_until',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Leased until'),
+        ),
+    ]
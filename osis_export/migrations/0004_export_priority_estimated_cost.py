@@ -0,0 +1,23 @@
+# Generated by Django 3.2.20 on 2026-10-18 10:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('osis_export', '0003_export_leased_until'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='export',
+            name='priority',
+            field=models.SmallIntegerField(default=0, verbose_name='Priority'),
+        ),
+        migrations.AddField(
+            model_name='export',
+            name='estimated_cost',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='Estimated cost'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.20 on 2026-10-18 11:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('osis_export', '0005_export_result_fingerprint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='export',
+            name='request_fingerprint',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=64, verbose_name='Request fingerprint'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.20 on 2026-10-18 12:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('osis_export', '0006_export_request_fingerprint'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='export',
+            name='type',
+            field=models.CharField(choices=[('EXCEL', 'Excel'), ('PDF', 'PDF'), ('CSV', 'CSV')], max_length=25, verbose_name='Type'),
+        ),
+    ]
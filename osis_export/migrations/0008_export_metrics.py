@@ -0,0 +1,18 @@
+# Generated by Django 3.2.20 on 2026-10-18 12:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('osis_export', '0007_alter_export_type'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='export',
+            name='metrics',
+            field=models.JSONField(blank=True, default=dict, editable=False, verbose_name='Metrics'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.20 on 2026-10-18 12:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('osis_export', '0008_export_metrics'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='export',
+            name='type',
+            field=models.CharField(choices=[('EXCEL', 'Excel'), ('PDF', 'PDF'), ('CSV', 'CSV'), ('PARQUET', 'Parquet')], max_length=25, verbose_name='Type'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 3.2.20 on 2026-10-18 13:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('osis_export', '0009_alter_export_type'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='export',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0, editable=False, verbose_name='Attempts'),
+        ),
+        migrations.AddField(
+            model_name='export',
+            name='failed_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Failed at'),
+        ),
+        migrations.AddField(
+            model_name='export',
+            name='last_error',
+            field=models.TextField(blank=True, editable=False, verbose_name='Last error'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.2.20 on 2026-10-18 14:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('osis_export', '0010_export_attempts'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='export',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Created at'),
+        ),
+        migrations.AlterField(
+            model_name='export',
+            name='job_uuid',
+            field=models.UUIDField(db_index=True, verbose_name='UUID of the related task job'),
+        ),
+    ]
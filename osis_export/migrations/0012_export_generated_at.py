@@ -0,0 +1,18 @@
+# Generated by Django 3.2.20 on 2026-10-18 16:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('osis_export', '0011_export_job_uuid_created_at_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='export',
+            name='generated_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Generated at'),
+        ),
+    ]
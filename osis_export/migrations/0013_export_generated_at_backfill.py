@@ -0,0 +1,21 @@
+# Generated by Django 3.2.20 on 2026-10-18 18:10
+
+from django.db import migrations
+from django.db.models import F
+
+
+def set_generated_at(apps, schema_editor):
+    # the exports claimed before are not generated again, even if their generation was interrupted
+    Export = apps.get_model('osis_export', 'Export')
+    Export.objects.filter(leased_until__isnull=False, generated_at__isnull=True).update(generated_at=F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('osis_export', '0012_export_generated_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(set_generated_at, migrations.RunPython.noop),
+    ]
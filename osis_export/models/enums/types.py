@@ -6,3 +6,5 @@ from base.models.utils.utils import ChoiceEnum
 class ExportTypes(ChoiceEnum):
     EXCEL = _("Excel")
     PDF = _("PDF")
+    CSV = _("CSV")
+    PARQUET = _("Parquet")
@@ -1,23 +1,146 @@
+import datetime
+import hashlib
+import json
+import logging
+from typing import Optional
+
 from django.conf import settings
-from django.db import models
-from django.utils.module_loading import import_string
+from django.db import models, transaction
+from django.db.models import F, Q
+from django.http import QueryDict
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
 from base.models.person import Person
 from osis_document.contrib import FileField
 from osis_document.enums import DocumentExpirationPolicy
+from osis_export.contrib.registry import get_async_manager_class, get_class
 from osis_export.models.enums.types import ExportTypes
 from osis_export.models.validators import validate_export_mixin_inheritance
 
 
+class ExportLeaseLost(Exception):
+    """Raised when the lease of an export being generated was lost, another generation claimed it"""
+
+
 class ExportManager(models.Manager):
     def not_generated(self):
         """Returns all the pending export jobs"""
-        pending_jobs_uuid = import_string(
-            settings.OSIS_EXPORT_ASYNCHRONOUS_MANAGER_CLS
-        ).get_pending_job_uuids()
+        # a queryset is not evaluated, but used as a subquery of a single SQL query
+        pending_jobs_uuid = get_async_manager_class().get_pending_job_uuids()
         return self.get_queryset().filter(job_uuid__in=pending_jobs_uuid)
 
+    def claimable(self):
+        """Returns the export jobs to generate that are not leased by a running generation: the
+        pending ones, and the ones whose generation was interrupted (e.g. the worker was killed),
+        their task being left in progress"""
+        pending_jobs_uuid = get_async_manager_class().get_pending_job_uuids()
+        return (
+            self.get_queryset()
+            .filter(Q(job_uuid__in=pending_jobs_uuid) | Q(leased_until__isnull=False, generated_at__isnull=True))
+            .filter(Q(leased_until__isnull=True) | Q(leased_until__lte=timezone.now()), failed_at__isnull=True)
+            # the most important, then the smallest exports first
+            .order_by("-priority", F("estimated_cost").asc(nulls_last=True), "created_at")
+        )
+
+    def generating(self):
+        """Returns the export jobs being generated by a running generation"""
+        return self.filter(
+            leased_until__gt=timezone.now(),
+            generated_at__isnull=True,
+            failed_at__isnull=True,
+        ).exclude(pk__in=self.not_generated().values("pk"))
+
+    def claim(self, limit=None, export_ids=None, request_fingerprint=None, min_cost=None, max_cost=None):
+        """Lease and return the claimable export jobs (the given ones or the ones with the
+        given request fingerprint, if any, and within the given cost range), so that
+        concurrent or overlapping generations never process the same export twice."""
+        with transaction.atomic():
+            queryset = filter_by_cost(self.claimable(), min_cost, max_cost).select_for_update(skip_locked=True)
+            if export_ids:
+                queryset = queryset.filter(pk__in=export_ids)
+            if request_fingerprint:
+                queryset = queryset.filter(request_fingerprint=request_fingerprint)
+            exports = list(queryset[:limit])
+            leased_until = timezone.now() + get_lease_duration()
+            self.filter(pk__in=[export.pk for export in exports]).update(leased_until=leased_until)
+        for export in exports:
+            export.leased_until = leased_until
+        return exports
+
+    def expired(self):
+        """Returns the export jobs kept for longer than the retention age, and not being generated"""
+        now = timezone.now()
+        return (
+            self.get_queryset()
+            .filter(created_at__lt=now - get_retention_age())
+            .exclude(leased_until__gt=now)
+        )
+
+    def failed(self):
+        """Returns the export jobs that failed for good, not to be generated again"""
+        return self.get_queryset().filter(failed_at__isnull=False)
+
+    def cached_result(self, result_fingerprint: str) -> Optional["Export"]:
+        """Returns the latest generated export with the same result, whose file can be reused"""
+        return (
+            self.filter(
+                result_fingerprint=result_fingerprint,
+                created_at__gte=timezone.now() - get_result_cache_ttl(),
+            )
+            .order_by("-created_at")
+            .first()
+        )
+
+
+def filter_by_cost(queryset, min_cost: Optional[int] = None, max_cost: Optional[int] = None):
+    """Returns the exports estimated to cost at least `min_cost` and less than `max_cost`,
+    the ones whose cost is unknown being considered the smallest"""
+    if min_cost is not None:
+        queryset = queryset.filter(estimated_cost__gte=min_cost)
+    if max_cost is not None:
+        queryset = queryset.filter(Q(estimated_cost__lt=max_cost) | Q(estimated_cost__isnull=True))
+    return queryset
+
+
+def get_lease_duration() -> datetime.timedelta:
+    """Returns how long an export is reserved for the generation that claimed it"""
+    return getattr(settings, "OSIS_EXPORT_LEASE_DURATION", datetime.timedelta(minutes=15))
+
+
+def get_max_attempts() -> int:
+    """Returns how many times the generation of an export is attempted on transient errors"""
+    return getattr(settings, "OSIS_EXPORT_MAX_ATTEMPTS", 3)
+
+
+def get_retry_delay(attempts: int) -> datetime.timedelta:
+    """Returns how long to wait before the next attempt, doubling after each one"""
+    return getattr(settings, "OSIS_EXPORT_RETRY_DELAY", datetime.timedelta(minutes=1)) * 2 ** (attempts - 1)
+
+
+def get_expiration_age() -> datetime.timedelta:
+    """Returns how long the file of an export is kept by osis_document"""
+    return getattr(settings, "OSIS_DOCUMENT_EXPORT_EXPIRATION_POLICY_AGE", datetime.timedelta(days=15))
+
+
+def get_retention_age() -> datetime.timedelta:
+    """Returns how long an export is kept, never less than the expiration age of its file"""
+    retention_age = getattr(settings, "OSIS_EXPORT_RETENTION_AGE", None)
+    return max(retention_age or get_expiration_age(), get_expiration_age())
+
+
+def get_result_cache_ttl() -> datetime.timedelta:
+    """Returns how long the file of an export can be reused, always less than its expiration age"""
+    ttl = getattr(settings, "OSIS_EXPORT_RESULT_CACHE_TTL", datetime.timedelta(days=1))
+    return min(ttl, get_expiration_age())
+
+
+def normalize_filters(filters: str) -> list:
+    """Returns the filters of an export sorted by name, without the empty ones"""
+    return sorted(
+        (name, values) for name, values in QueryDict(filters).lists() if any(value != "" for value in values)
+    )
+
 
 class Export(models.Model):
     """Represent an export task. It must contains the base app label and model name,
@@ -31,7 +154,7 @@ class Export(models.Model):
     )
     filters = models.TextField(_("Filters"), blank=True)
     person = models.ForeignKey(Person, on_delete=models.CASCADE, related_name="+")
-    job_uuid = models.UUIDField(_("UUID of the related task job"))
+    job_uuid = models.UUIDField(_("UUID of the related task job"), db_index=True)
     file = FileField(
         null=True,
         blank=True,
@@ -39,10 +162,144 @@ class Export(models.Model):
     )
     file_name = models.CharField(_("File name"), max_length=100)
     type = models.CharField(_("Type"), choices=ExportTypes.choices(), max_length=25)
-    created_at = models.DateTimeField(_("Created at"), auto_now_add=True)
+    created_at = models.DateTimeField(_("Created at"), auto_now_add=True, db_index=True)
     extra_data = models.JSONField(
         verbose_name=_("Extra data"),
         blank=True,
         default=dict,
     )
+    priority = models.SmallIntegerField(_("Priority"), default=0)
+    estimated_cost = models.PositiveIntegerField(
+        _("Estimated cost"),
+        null=True,
+        blank=True,
+        editable=False,
+    )
+    request_fingerprint = models.CharField(
+        _("Request fingerprint"),
+        max_length=64,
+        blank=True,
+        db_index=True,
+        editable=False,
+    )
+    result_fingerprint = models.CharField(
+        _("Result fingerprint"),
+        max_length=64,
+        blank=True,
+        db_index=True,
+        editable=False,
+    )
+    metrics = models.JSONField(
+        verbose_name=_("Metrics"),
+        blank=True,
+        default=dict,
+        editable=False,
+    )
+    leased_until = models.DateTimeField(
+        _("Leased until"),
+        null=True,
+        blank=True,
+        editable=False,
+    )
+    attempts = models.PositiveSmallIntegerField(_("Attempts"), default=0, editable=False)
+    last_error = models.TextField(_("Last error"), blank=True, editable=False)
+    failed_at = models.DateTimeField(
+        _("Failed at"),
+        null=True,
+        blank=True,
+        editable=False,
+    )
+    generated_at = models.DateTimeField(
+        _("Generated at"),
+        null=True,
+        blank=True,
+        editable=False,
+    )
     objects = ExportManager()
+
+    def renew_lease(self) -> bool:
+        """Extend the lease of the export while it is being generated, returns False if it
+        was lost meanwhile (expired, then claimed by another generation)"""
+        leased_until = timezone.now() + get_lease_duration()
+        if not Export.objects.filter(pk=self.pk, leased_until=self.leased_until).update(leased_until=leased_until):
+            return False
+        self.leased_until = leased_until
+        return True
+
+    def release_lease(self) -> None:
+        """Give up the export before generating it, another generation being able to claim it at once"""
+        # an expired lease, the export is claimable again even if its task was left in progress
+        leased_until = timezone.now()
+        if Export.objects.filter(pk=self.pk, leased_until=self.leased_until).update(leased_until=leased_until):
+            self.leased_until = leased_until
+
+    def is_within_cost_range(self, min_cost: Optional[int] = None, max_cost: Optional[int] = None) -> bool:
+        """Returns whether the export is estimated to cost at least `min_cost` and less than `max_cost`,
+        an unknown cost being considered the smallest, as for filter_by_cost"""
+        if self.estimated_cost is None:
+            return min_cost is None
+        return (min_cost is None or self.estimated_cost >= min_cost) and (
+            max_cost is None or self.estimated_cost < max_cost
+        )
+
+    def schedule_retry(self, error: Exception) -> None:
+        """Record the failed attempt, the export being claimable again once its retry delay is over"""
+        self.attempts += 1
+        self.last_error = repr(error)
+        # the export is leased until its next attempt
+        self.leased_until = timezone.now() + get_retry_delay(self.attempts)
+        Export.objects.filter(pk=self.pk).update(
+            attempts=self.attempts,
+            last_error=self.last_error,
+            leased_until=self.leased_until,
+        )
+
+    def mark_failed(self, error: Exception) -> None:
+        """Record the last failed attempt, the export is never generated again"""
+        self.attempts += 1
+        self.last_error = repr(error)
+        self.failed_at = timezone.now()
+        Export.objects.filter(pk=self.pk).update(
+            attempts=self.attempts,
+            last_error=self.last_error,
+            failed_at=self.failed_at,
+        )
+
+    def can_be_retried(self) -> bool:
+        return self.attempts + 1 < get_max_attempts()
+
+    def estimate_cost(self) -> Optional[int]:
+        """Estimate the cost of the export from its view class, once"""
+        if self.estimated_cost is None:
+            try:
+                base_class_instance = get_class(self.called_from_class)()
+                self.estimated_cost = base_class_instance.get_export_cost(filters=self.filters, person=self.person)
+            except Exception as e:
+                # the error will be reported when generating the export
+                logging.getLogger(settings.DEFAULT_LOGGER).warning(e)
+                return None
+            Export.objects.filter(pk=self.pk).update(estimated_cost=self.estimated_cost)
+        return self.estimated_cost
+
+    def get_language(self) -> str:
+        """Returns the language the export is generated in"""
+        return self.person.language or settings.LANGUAGE_CODE
+
+    def get_request_fingerprint(self, language: str, person_specific: bool = True) -> str:
+        """Returns a hash identifying the requested export"""
+        content = [
+            self.called_from_class,
+            self.type,
+            normalize_filters(self.filters),
+            language,
+            self.person_id if person_specific else None,
+        ]
+        return hashlib.sha256(json.dumps(content).encode()).hexdigest()
+
+    def get_result_fingerprint(self, language: str, data_version, person_specific: bool = True) -> str:
+        """Returns a hash identifying the content of the generated file"""
+        content = [
+            self.get_request_fingerprint(language, person_specific),
+            str(data_version),
+        ]
+        return hashlib.sha256(json.dumps(content).encode()).hexdigest()
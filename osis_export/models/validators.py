@@ -1,8 +1,7 @@
 from django.core.exceptions import ValidationError
-from django.utils.module_loading import import_string
 from django.utils.translation import gettext_lazy as _
 
-from osis_export.contrib.export_mixins import ExportMixin, FileExportMixin
+from osis_export.contrib.registry import is_export_class
 
 
 export_mixin_inheritance_error_msg = _(
@@ -14,8 +13,8 @@ def validate_export_mixin_inheritance(classname: str) -> None:
     """Validate the given classname inherit from ExportMixin and FileExportMixin,
     raises ValidationError if not."""
     try:
-        BaseClass = import_string(classname)
+        valid = is_export_class(classname)
     except ImportError as error:
         raise ValidationError(error)
-    if not issubclass(BaseClass, (ExportMixin, FileExportMixin)):
+    if not valid:
         raise ValidationError(export_mixin_inheritance_error_msg)
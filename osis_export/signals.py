@@ -0,0 +1,4 @@
+from django.dispatch import Signal
+
+# Sent once an export has been generated, with the `export` and its `metrics` (as dict)
+export_generated = Signal()
@@ -25,14 +25,19 @@
 # ##############################################################################
 
 from celery.schedules import crontab
+from django.conf import settings
 
 from backoffice.celery import app as celery_app
-from . import generate_export_file
+from . import cleanup_exports, generate_export_file
 
 tasks = {
     '|Export| Generate exports': {
         'task': 'osis_export.tasks.generate_export_file.run',
-        'schedule': crontab()
+        'schedule': getattr(settings, 'OSIS_EXPORT_GENERATION_SCHEDULE', crontab())
+    },
+    '|Export| Clean up expired exports': {
+        'task': 'osis_export.tasks.cleanup_exports.run',
+        'schedule': getattr(settings, 'OSIS_EXPORT_CLEANUP_SCHEDULE', crontab(minute=0, hour=3))
     },
 }
 celery_app.conf.beat_schedule.update(tasks)
@@ -0,0 +1,10 @@
+from django.core.management import call_command
+
+from backoffice.celery import app as celery_app
+
+
+@celery_app.task
+def run():
+    """This job will launch the Django command that will delete the expired exports."""
+
+    call_command("cleanup_exports")
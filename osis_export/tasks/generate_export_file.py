@@ -1,11 +1,76 @@
+from typing import Dict, Iterable, Optional, Tuple
+
+from django.conf import settings
 from django.core.management import call_command
 
 from backoffice.celery import app as celery_app
+from osis_export.models import Export
+from osis_export.models.export import filter_by_cost
+
+
+def get_queue_cost_ranges() -> Dict[Optional[str], Tuple[Optional[int], Optional[int]]]:
+    """Return the range of costs (minimum included, maximum excluded) of the exports
+    generated by each queue, None being the default one"""
+    threshold = getattr(settings, "OSIS_EXPORT_LARGE_EXPORT_THRESHOLD", None)
+    queue = getattr(settings, "OSIS_EXPORT_LARGE_EXPORT_QUEUE", None)
+    if threshold is None or queue is None:
+        return {None: (None, None)}
+    return {None: (None, threshold), queue: (threshold, None)}
+
+
+def get_generation_batch_size() -> int:
+    """Return the number of exports claimed at once by each generation, whose final task
+    updates and notifications are sent together"""
+    return getattr(settings, "OSIS_EXPORT_GENERATION_BATCH_SIZE", 10)
+
+
+def dispatch(exports: Iterable[Export]) -> None:
+    """Send the generation of the given exports to the default queue. Their cost is estimated
+    once claimed, the ones found too large being left to the workers of the large exports
+    queue (dispatched by dispatch_workers)."""
+    _, max_cost = get_queue_cost_ranges()[None]
+    options = {"kwargs": {"max_cost": max_cost}} if max_cost is not None else {}
+    generate.apply_async(args=[[export.pk for export in exports]], **options)
+
+
+def dispatch_workers(concurrency: int) -> None:
+    """Send as many sub-tasks as needed for at most `concurrency` exports to be generated at
+    the same time per queue, each of them generating the pending exports until none is left.
+    The sub-tasks not started before OSIS_EXPORT_DISPATCH_EXPIRES seconds are dropped, the
+    next run sending new ones if still needed."""
+    expires = getattr(settings, "OSIS_EXPORT_DISPATCH_EXPIRES", 60)
+    for queue, (min_cost, max_cost) in get_queue_cost_ranges().items():
+        generating = filter_by_cost(Export.objects.generating(), min_cost, max_cost).count()
+        pending = filter_by_cost(Export.objects.claimable(), min_cost, max_cost).count()
+        options = {"queue": queue} if queue else {}
+        for _ in range(min(concurrency - generating, pending)):
+            generate.apply_async(kwargs={"min_cost": min_cost, "max_cost": max_cost}, expires=expires, **options)
 
 
 @celery_app.task
 def run():
     """This job will launch the Django command that will generate all the Export's
-    files."""
+    files. If OSIS_EXPORT_GENERATION_CONCURRENCY is greater than 1 or if the large
+    exports have their own queue, sub-tasks generating the pending exports in parallel
+    are dispatched instead."""
+
+    concurrency = getattr(settings, "OSIS_EXPORT_GENERATION_CONCURRENCY", 1)
+    if concurrency <= 1 and getattr(settings, "OSIS_EXPORT_LARGE_EXPORT_QUEUE", None) is None:
+        call_command("generate_export_file", batch_size=get_generation_batch_size())
+        return
+
+    dispatch_workers(concurrency)
+
+
+@celery_app.task
+def generate(export_ids=None, min_cost=None, max_cost=None):
+    """This job will generate the files of the given exports, if still pending, or of
+    all the pending exports within the given cost range."""
 
-    call_command("generate_export_file")
+    call_command(
+        "generate_export_file",
+        export=export_ids or [],
+        batch_size=get_generation_batch_size(),
+        min_cost=min_cost,
+        max_cost=max_cost,
+    )
@@ -0,0 +1,170 @@
+import importlib.util
+import io
+import multiprocessing
+import os
+import resource
+import sys
+import time
+import traceback
+from unittest import skipUnless
+
+from django.test import TestCase
+from django_filters.views import FilterView
+
+from osis_export.contrib.export_mixins import (
+    CsvFilterSetExportMixin,
+    ExcelFilterSetExportMixin,
+    ExportColumn,
+    ParquetFilterSetExportMixin,
+)
+from osis_export.contrib.metrics import ExportMetrics
+from osis_export.tests.export_test.models import DummyModel
+from osis_export.tests.export_test.views import DummyFilter
+
+# Run with: OSIS_EXPORT_BENCHMARK=1 python manage.py test osis_export.tests.test_benchmarks
+BENCHMARK_ENABLED = os.environ.get("OSIS_EXPORT_BENCHMARK")
+# Comma separated numbers of exported rows
+BENCHMARK_SIZES = os.environ.get("OSIS_EXPORT_BENCHMARK_SIZES", "10000,100000,1000000")
+
+
+class BenchmarkRowsMixin:
+    filterset_class = DummyFilter
+
+    def get_header(self):
+        return ["id", "name", "selectable value"]
+
+    def get_row_data(self, row):
+        return [row.pk, row.name, row.selectable_value]
+
+
+class ExcelBenchmarkView(BenchmarkRowsMixin, ExcelFilterSetExportMixin, FilterView):
+    write_only = False
+
+
+class ExcelWriteOnlyBenchmarkView(BenchmarkRowsMixin, ExcelFilterSetExportMixin, FilterView):
+    write_only = True
+
+
+class ExcelColumnsBenchmarkView(ExcelFilterSetExportMixin, FilterView):
+    filterset_class = DummyFilter
+    write_only = True
+    export_columns = [
+        ExportColumn("pk", "id"),
+        ExportColumn("name", "name"),
+        ExportColumn("selectable_value", "selectable value"),
+    ]
+
+
+class CsvBenchmarkView(BenchmarkRowsMixin, CsvFilterSetExportMixin, FilterView):
+    pass
+
+
+class CsvGzipBenchmarkView(BenchmarkRowsMixin, CsvFilterSetExportMixin, FilterView):
+    gzip_compression = True
+
+
+class CsvColumnsBenchmarkView(CsvFilterSetExportMixin, FilterView):
+    filterset_class = DummyFilter
+    export_columns = ExcelColumnsBenchmarkView.export_columns
+
+
+class ParquetBenchmarkView(BenchmarkRowsMixin, ParquetFilterSetExportMixin, FilterView):
+    pass
+
+
+class ParquetColumnsBenchmarkView(ParquetFilterSetExportMixin, FilterView):
+    filterset_class = DummyFilter
+    export_columns = ExcelColumnsBenchmarkView.export_columns
+
+
+BENCHMARKED_VIEWS = [
+    ("excel", ExcelBenchmarkView),
+    ("excel write-only", ExcelWriteOnlyBenchmarkView),
+    ("excel columns", ExcelColumnsBenchmarkView),
+    ("csv", CsvBenchmarkView),
+    ("csv gzip", CsvGzipBenchmarkView),
+    ("csv columns", CsvColumnsBenchmarkView),
+]
+if importlib.util.find_spec("pyarrow"):
+    BENCHMARKED_VIEWS += [
+        ("parquet", ParquetBenchmarkView),
+        ("parquet columns", ParquetColumnsBenchmarkView),
+    ]
+
+
+@skipUnless(BENCHMARK_ENABLED, "Set OSIS_EXPORT_BENCHMARK to run the export benchmarks")
+class TestExportBenchmark(TestCase):
+    """Measure the throughput and the peak memory of the file generation of each export
+    mixin, for increasing numbers of rows"""
+
+    def test_benchmark_export_generation(self):
+        results = []
+        for size in sorted(int(size) for size in BENCHMARK_SIZES.split(",")):
+            self.create_rows(size)
+            for name, view_class in BENCHMARKED_VIEWS:
+                results.append(self.benchmark(name, view_class, size))
+        self.report(results)
+
+    @staticmethod
+    def create_rows(size, batch_size=10000):
+        for start in range(DummyModel.objects.count(), size, batch_size):
+            DummyModel.objects.bulk_create(
+                DummyModel(name="name {}".format(i), selectable_value="ABC"[i % 3])
+                for i in range(start, min(start + batch_size, size))
+            )
+
+    def benchmark(self, name, view_class, size):
+        """Generate the file in a forked process, so that its peak resident memory, including
+        the native allocations (e.g. of pyarrow or lxml), is the one of this writer only. The
+        process reads the rows through the connection of the test, while the test waits."""
+        context = multiprocessing.get_context("fork")
+        receiver, sender = context.Pipe(duplex=False)
+        process = context.Process(target=self.generate, args=(sender, view_class, size))
+        process.start()
+        sender.close()
+        result = receiver.recv()
+        process.join()
+        if "error" in result:
+            self.fail(result["error"])
+        return {"name": name, "size": size, **result}
+
+    @staticmethod
+    def generate(sender, view_class, size):
+        try:
+            # the memory of the process when forked, shared with the test
+            start_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            view = view_class()
+            metrics = view.export_metrics
+            start = time.perf_counter()
+            with metrics.measure(ExportMetrics.GENERATION):
+                file = view.generate_file(person=None, filters="")
+            duration = time.perf_counter() - start
+            with file:
+                metrics.output_bytes = file.seek(0, io.SEEK_END)
+            assert metrics.row_count == size
+            # in kB on Linux, in bytes on macOS
+            peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - start_rss
+            if sys.platform == "darwin":
+                peak_rss //= 1024
+            sender.send({"rows_per_second": int(size / duration), "peak_rss_kb": peak_rss, **metrics.as_dict()})
+        except BaseException:
+            sender.send({"error": traceback.format_exc()})
+
+    @staticmethod
+    def report(results):
+        columns = [
+            ("writer", lambda result: result["name"]),
+            ("rows", lambda result: result["size"]),
+            ("rows/s", lambda result: result["rows_per_second"]),
+            ("query (s)", lambda result: result["durations"].get(ExportMetrics.QUERY)),
+            ("formatting (s)", lambda result: result["durations"].get(ExportMetrics.FORMATTING)),
+            ("serialization (s)", lambda result: result["durations"].get(ExportMetrics.SERIALIZATION)),
+            ("output (kB)", lambda result: result["output_bytes"] // 1024),
+            ("peak RSS (kB)", lambda result: result["peak_rss_kb"]),
+        ]
+        lines = [[title for title, _ in columns]]
+        lines += [[str(value(result)) for _, value in columns] for result in results]
+        widths = [max(len(line[i]) for line in lines) for i in range(len(columns))]
+        sys.stdout.write("\n")
+        for line in lines:
+            sys.stdout.write("  ".join(cell.rjust(width) for cell, width in zip(line, widths)) + "\n")
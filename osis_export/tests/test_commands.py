@@ -1,13 +1,24 @@
+import datetime
+import io
+import os
+import tempfile
 import uuid
-from unittest.mock import patch, Mock
+from unittest.mock import ANY, patch, Mock
 
 from django.core.management import call_command
+from django.db import OperationalError
 from django.test import TestCase, override_settings
+from django.utils import timezone
 from osis_async.models.enums import TaskState
+from osis_notification.models import WebNotification
 
 from base.tests.factories.person import PersonFactory
+from osis_export.contrib.metrics import ExportQueryBudgetExceeded
+from osis_export.contrib.upload import RemoteUploadUnavailable
 from osis_export.models import Export
+from osis_export.signals import export_generated
 from osis_export.tests.export_test.models import DummyModel
+from osis_export.tests.export_test.views import TestViewSearch
 from osis_export.tests.factory import ExportFactory
 
 
@@ -43,6 +54,13 @@ class TestGenerateExportFile(TestCase):
         patcher.start()
         self.addCleanup(patcher.stop)
 
+        patcher = patch(
+            "osis_export.management.commands.generate_export_file.save_file_remotely",
+            side_effect=lambda file, file_name, file_mimetype: "foobar",
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
         patcher = patch(
             "osis_document.api.utils.confirm_remote_upload",
             side_effect=lambda token, upload_to: uuid.uuid4(),
@@ -76,6 +94,278 @@ class TestGenerateExportFile(TestCase):
         self.assertEqual(len(self.export.file), 1)
         self.assertEqual(len(self.export_2.file), 1)
 
+    @patch('osis_export.tests.export_test.async_manager.AsyncTaskManager.get_pending_job_uuids')
+    def test_generate_export_file_records_metrics(self, pending_job_uuids):
+        pending_job_uuids.return_value = [self.export.job_uuid]
+        receiver = Mock()
+        export_generated.connect(receiver)
+        self.addCleanup(export_generated.disconnect, receiver)
+
+        call_command("generate_export_file")
+
+        self.export.refresh_from_db()
+        metrics = self.export.metrics
+        self.assertEqual(metrics["row_count"], DummyModel.objects.count())
+        self.assertGreater(metrics["output_bytes"], 0)
+        self.assertCountEqual(
+            metrics["durations"].keys(),
+            ["query", "formatting", "serialization", "upload", "token"],
+        )
+        receiver.assert_called_once()
+        self.assertEqual(receiver.call_args[1]["export"], self.export)
+        self.assertEqual(receiver.call_args[1]["metrics"], metrics)
+
+    @patch('osis_export.tests.export_test.async_manager.AsyncTaskManager.get_pending_job_uuids')
+    def test_generate_export_file_traces_memory_of_each_export(self, pending_job_uuids):
+        pending_job_uuids.return_value = [self.export.job_uuid, self.export_2.job_uuid]
+        allocations = []
+        row_count = 0
+
+        def get_row_data(view, row):
+            nonlocal row_count
+            row_count += 1
+            # the first generated export allocates much more memory than the second one
+            if row_count <= 42:
+                allocations.append(bytes(100 * 1024))
+            else:
+                allocations.clear()
+            return [row.name]
+
+        with patch.object(TestViewSearch, "get_row_data", get_row_data):
+            call_command("generate_export_file")
+            self.export.refresh_from_db()
+            self.assertNotIn("peak_memory_kb", self.export.metrics)
+
+            Export.objects.update(leased_until=None, generated_at=None)
+            allocations.clear()
+            row_count = 0
+            call_command("generate_export_file", "--trace-memory")
+        first, second = sorted(
+            Export.objects.filter(pk__in=[self.export.pk, self.export_2.pk]).values_list("metrics", flat=True),
+            key=lambda metrics: -metrics["peak_memory_kb"],
+        )
+        self.assertGreater(first["peak_memory_kb"], 4000)
+        # not the peak of the previous export
+        self.assertLess(second["peak_memory_kb"], 1000)
+
+    @patch('osis_export.tests.export_test.async_manager.AsyncTaskManager.get_pending_job_uuids')
+    @patch('osis_export.tests.export_test.async_manager.AsyncTaskManager.update')
+    @patch.multiple(TestViewSearch, export_batch_size=10, export_progress_every_rows=10, export_progress_interval=0)
+    def test_generate_export_file_reports_progression(self, update, pending_job_uuids):
+        pending_job_uuids.return_value = [self.export.job_uuid]
+        call_command("generate_export_file")
+        progressions = [c[1]["progression"] for c in update.call_args_list]
+        # 42 rows, reported every 10 rows
+        self.assertEqual(progressions, [1, 24, 47, 71, 94, 100])
+
+    @patch('osis_export.tests.export_test.async_manager.AsyncTaskManager.get_pending_job_uuids')
+    @patch.object(TestViewSearch, "export_batch_size", 20)
+    def test_generate_export_file_detects_n_plus_one_queries(self, pending_job_uuids):
+        pending_job_uuids.return_value = [self.export.job_uuid]
+
+        with patch.object(TestViewSearch, "get_row_data", lambda view, row: [row.name, DummyModel.objects.count()]):
+            with self.assertLogs(level="WARNING"):
+                call_command("generate_export_file", "--check-queries")
+
+        self.export.refresh_from_db()
+        self.assertTrue(self.export.metrics["n_plus_one_queries"])
+        self.assertEqual(
+            [row_count for row_count, query_count in self.export.metrics["batch_query_counts"]],
+            [20, 20, 2],
+        )
+
+    @patch('osis_export.tests.export_test.async_manager.AsyncTaskManager.get_pending_job_uuids')
+    @patch.object(TestViewSearch, "export_batch_size", 20)
+    def test_generate_export_file_without_n_plus_one_queries(self, pending_job_uuids):
+        pending_job_uuids.return_value = [self.export.job_uuid]
+        call_command("generate_export_file", "--check-queries")
+        self.export.refresh_from_db()
+        self.assertFalse(self.export.metrics["n_plus_one_queries"])
+        self.assertEqual(self.export.metrics["query_count"], 1)
+
+    @patch('osis_export.tests.export_test.async_manager.AsyncTaskManager.get_pending_job_uuids')
+    @patch.multiple(TestViewSearch, export_batch_size=20, export_query_budget=5)
+    def test_generate_export_file_enforces_query_budget(self, pending_job_uuids):
+        pending_job_uuids.return_value = [self.export.job_uuid]
+        # only checked when counting queries
+        call_command("generate_export_file")
+
+        pending_job_uuids.return_value = [self.export_2.job_uuid]
+        with patch.object(TestViewSearch, "get_row_data", lambda view, row: [row.name, DummyModel.objects.count()]):
+            call_command("generate_export_file", "--check-queries")
+        self.export_2.refresh_from_db()
+        self.assertIsNotNone(self.export_2.failed_at)
+        self.assertIn(ExportQueryBudgetExceeded.__name__, self.export_2.last_error)
+
+    @patch('osis_export.tests.export_test.async_manager.AsyncTaskManager.get_pending_job_uuids')
+    @patch('osis_export.management.commands.generate_export_file.save_file_remotely')
+    def test_generate_export_file_uploads_generated_file_object(self, save_file, pending_job_uuids):
+        save_file.return_value = str(uuid.uuid4())
+        pending_job_uuids.return_value = [self.export.job_uuid]
+        call_command("generate_export_file")
+        file = save_file.call_args[0][0]
+        self.assertNotIsInstance(file, bytes)
+        # closed, and so deleted, once uploaded
+        self.assertTrue(file.closed)
+
+    @patch('osis_export.tests.export_test.async_manager.AsyncTaskManager.get_pending_job_uuids')
+    @patch('osis_export.management.commands.generate_export_file.save_file_remotely')
+    @patch.object(TestViewSearch, "zip_archive", True, create=True)
+    def test_generate_export_file_uploads_archive(self, save_file, pending_job_uuids):
+        save_file.return_value = str(uuid.uuid4())
+        pending_job_uuids.return_value = [self.export.job_uuid]
+        call_command("generate_export_file")
+        file, file_name, file_mimetype = save_file.call_args[0]
+        self.assertEqual(file_name, "{}.zip".format(self.export.file_name))
+        self.assertEqual(file_mimetype, "application/zip")
+
+    @patch('osis_export.tests.export_test.async_manager.AsyncTaskManager.get_pending_job_uuids')
+    @patch('osis_export.tests.export_test.async_manager.AsyncTaskManager.bulk_create_notifications')
+    @patch('osis_export.tests.export_test.async_manager.AsyncTaskManager.bulk_update')
+    def test_generate_export_file_batches_updates_and_notifications(
+        self,
+        bulk_update,
+        bulk_create_notifications,
+        pending_job_uuids,
+    ):
+        pending_job_uuids.return_value = [
+            self.export.job_uuid,
+            self.export_2.job_uuid,
+        ]
+        call_command("generate_export_file", "--batch-size", "2")
+        # the processing state of each export, then the done state of both at once
+        self.assertEqual(bulk_update.call_count, 3)
+        done_updates = bulk_update.call_args_list[-1][0][0]
+        self.assertCountEqual([job_uuid for job_uuid, _ in done_updates], [self.export.job_uuid, self.export_2.job_uuid])
+        self.assertTrue(all(kwargs["state"] == TaskState.DONE for _, kwargs in done_updates))
+        bulk_create_notifications.assert_called_once()
+        notifications = bulk_create_notifications.call_args[0][0]
+        self.assertCountEqual([n.person for n in notifications], [self.export.person, self.export_2.person])
+
+    @patch('osis_export.tests.export_test.async_manager.AsyncTaskManager.get_pending_job_uuids')
+    @patch('osis_export.tests.export_test.async_manager.AsyncTaskManager.bulk_create_notifications')
+    def test_generate_export_file_sends_again_updates_and_notifications_not_sent(
+        self,
+        bulk_create_notifications,
+        pending_job_uuids,
+    ):
+        pending_job_uuids.return_value = [
+            self.export.job_uuid,
+            self.export_2.job_uuid,
+        ]
+        bulk_create_notifications.side_effect = [OperationalError("Database unavailable"), None]
+        with self.assertLogs(level="ERROR"):
+            call_command("generate_export_file")
+        # the notification of the first batch is sent with the one of the second batch
+        self.assertEqual(bulk_create_notifications.call_count, 2)
+        notifications = bulk_create_notifications.call_args[0][0]
+        self.assertCountEqual([n.person for n in notifications], [self.export.person, self.export_2.person])
+
+    @patch('osis_export.tests.export_test.async_manager.AsyncTaskManager.get_pending_job_uuids')
+    @patch('osis_export.tests.export_test.async_manager.AsyncTaskManager.update')
+    def test_generate_export_file_falls_back_to_single_updates_and_notifications(self, update, pending_job_uuids):
+        pending_job_uuids.return_value = [self.export.job_uuid]
+        call_command("generate_export_file")
+        self.assertEqual([c[1]["state"] for c in update.call_args_list], [TaskState.PROCESSING, TaskState.DONE])
+        self.assertEqual(WebNotification.objects.filter(person=self.export.person).count(), 1)
+
+    @patch('osis_export.tests.export_test.async_manager.AsyncTaskManager.get_pending_job_uuids')
+    @patch('osis_export.tests.export_test.async_manager.AsyncTaskManager.bulk_create_notifications')
+    @patch('osis_export.tests.export_test.views.TestViewSearch.post_export_done', create=True)
+    def test_generate_export_file_calls_custom_post_export_done(
+        self,
+        post_export_done,
+        bulk_create_notifications,
+        pending_job_uuids,
+    ):
+        pending_job_uuids.return_value = [self.export.job_uuid]
+        call_command("generate_export_file")
+        post_export_done.assert_called_once()
+        bulk_create_notifications.assert_not_called()
+        self.export.refresh_from_db()
+        self.assertIn("notification", self.export.metrics["durations"])
+
+    @patch('osis_export.tests.export_test.async_manager.AsyncTaskManager.get_pending_job_uuids')
+    def test_generate_export_file_only_given_exports(self, pending_job_uuids):
+        pending_job_uuids.return_value = [
+            self.export.job_uuid,
+            self.export_2.job_uuid,
+        ]
+        call_command("generate_export_file", "--export", str(self.export_2.pk), "--export", str(self.export_3.pk))
+        self.export.refresh_from_db()
+        self.export_2.refresh_from_db()
+        self.export_3.refresh_from_db()
+        self.assertEqual(len(self.export.file), 0)
+        self.assertEqual(len(self.export_2.file), 1)
+        # not pending
+        self.assertEqual(len(self.export_3.file), 0)
+
+    @patch('osis_export.tests.export_test.async_manager.AsyncTaskManager.get_pending_job_uuids')
+    def test_generate_export_file_leaves_exports_out_of_its_cost_range(self, pending_job_uuids):
+        pending_job_uuids.return_value = [self.export.job_uuid]
+        # estimated once claimed, 42 rows
+        call_command("generate_export_file", "--max-cost", "10")
+        self.export.refresh_from_db()
+        self.assertEqual(self.export.estimated_cost, 42)
+        self.assertEqual(len(self.export.file), 0)
+        # claimable again at once, by the generation of the largest exports only
+        self.assertEqual(list(Export.objects.claim(max_cost=10)), [])
+        call_command("generate_export_file", "--min-cost", "10")
+        self.export.refresh_from_db()
+        self.assertEqual(len(self.export.file), 1)
+
+    @patch('osis_export.tests.export_test.async_manager.AsyncTaskManager.get_pending_job_uuids')
+    @patch('osis_export.management.commands.generate_export_file.save_file_remotely')
+    @patch.multiple(TestViewSearch, export_result_cache=True, export_person_specific=False)
+    @patch('osis_export.tests.export_test.views.TestViewSearch.get_export_data_version', return_value="v1")
+    def test_generate_export_file_reuses_cached_result(self, data_version, save_file, pending_job_uuids):
+        save_file.return_value = str(uuid.uuid4())
+        pending_job_uuids.return_value = [
+            self.export.job_uuid,
+            self.export_2.job_uuid,
+        ]
+        call_command("generate_export_file")
+        self.export.refresh_from_db()
+        self.export_2.refresh_from_db()
+        save_file.assert_called_once()
+        self.assertEqual(len(self.export.file), 1)
+        self.assertEqual(self.export.file, self.export_2.file)
+        # only the generated export can be reused
+        self.assertNotEqual(self.export.result_fingerprint, "")
+        self.assertEqual(self.export_2.result_fingerprint, "")
+
+    @patch('osis_export.tests.export_test.async_manager.AsyncTaskManager.get_pending_job_uuids')
+    @patch('osis_export.management.commands.generate_export_file.save_file_remotely')
+    @patch('osis_export.tests.export_test.views.TestViewSearch.get_export_data_version', return_value="v1")
+    def test_generate_export_file_without_result_cache(self, data_version, save_file, pending_job_uuids):
+        save_file.return_value = str(uuid.uuid4())
+        pending_job_uuids.return_value = [
+            self.export.job_uuid,
+            self.export_2.job_uuid,
+        ]
+        call_command("generate_export_file")
+        self.assertEqual(save_file.call_count, 2)
+        data_version.assert_not_called()
+
+    @patch('osis_export.tests.export_test.async_manager.AsyncTaskManager.get_pending_job_uuids')
+    @patch('osis_export.tests.export_test.async_manager.AsyncTaskManager.update')
+    @patch('osis_export.management.commands.generate_export_file.save_file_remotely')
+    def test_generate_export_file_once_for_identical_exports(self, save_file, update, pending_job_uuids):
+        save_file.return_value = str(uuid.uuid4())
+        Export.objects.filter(pk__in=[self.export.pk, self.export_2.pk]).update(request_fingerprint="same")
+        pending_job_uuids.return_value = [
+            self.export.job_uuid,
+            self.export_2.job_uuid,
+        ]
+        call_command("generate_export_file")
+        self.export.refresh_from_db()
+        self.export_2.refresh_from_db()
+        save_file.assert_called_once()
+        self.assertEqual(len(self.export.file), 1)
+        self.assertEqual(self.export.file, self.export_2.file)
+        done_job_uuids = [c[0][0] for c in update.call_args_list if c[1]["state"] == TaskState.DONE]
+        self.assertCountEqual(done_job_uuids, [self.export.job_uuid, self.export_2.job_uuid])
+
     @patch('osis_export.tests.export_test.async_manager.AsyncTaskManager.get_pending_job_uuids')
     @patch('osis_export.tests.export_test.async_manager.AsyncTaskManager.update')
     @patch('osis_export.tests.export_test.views.TestViewSearch.generate_file')
@@ -85,6 +375,234 @@ class TestGenerateExportFile(TestCase):
         ]
         generate_file.side_effect = Exception("Something went wrong")
 
-        with self.assertRaises(Exception):
+        call_command("generate_export_file")
+        update.assert_called_with(self.export.job_uuid, progression=0, state=TaskState.ERROR)
+        # not retried
+        self.export.refresh_from_db()
+        self.assertEqual(self.export.attempts, 1)
+        self.assertIsNotNone(self.export.failed_at)
+        self.assertEqual(self.export.last_error, "Exception('Something went wrong')")
+        self.assertEqual(list(Export.objects.failed()), [self.export])
+        self.assertEqual(list(Export.objects.claimable()), [])
+
+    @patch('osis_export.tests.export_test.async_manager.AsyncTaskManager.get_pending_job_uuids')
+    @patch('osis_export.tests.export_test.async_manager.AsyncTaskManager.update')
+    def test_generate_export_fails_when_view_is_missing(self, update, pending_job_uuids):
+        pending_job_uuids.return_value = [self.export.job_uuid]
+        Export.objects.filter(pk=self.export.pk).update(called_from_class="osis_export.tests.export_test.views.Missing")
+
+        call_command("generate_export_file")
+        update.assert_called_with(self.export.job_uuid, progression=0, state=TaskState.ERROR)
+        self.export.refresh_from_db()
+        self.assertEqual(self.export.attempts, 1)
+        self.assertIsNotNone(self.export.failed_at)
+        self.assertEqual(list(Export.objects.claimable()), [])
+
+    @patch('osis_export.tests.export_test.async_manager.AsyncTaskManager.get_pending_job_uuids')
+    @patch('osis_export.tests.export_test.async_manager.AsyncTaskManager.update')
+    @patch('osis_export.tests.export_test.async_manager.AsyncTaskManager.bulk_update')
+    def test_generate_export_retries_when_task_can_not_be_started(self, bulk_update, update, pending_job_uuids):
+        pending_job_uuids.return_value = [self.export.job_uuid]
+        # the task is set as processing, then as pending again once all the batch is generated
+        bulk_update.side_effect = [OperationalError("Database unavailable"), None]
+
+        call_command("generate_export_file")
+        self.assertEqual(
+            bulk_update.call_args[0][0],
+            [(self.export.job_uuid, dict(progression=0, state=TaskState.PENDING))],
+        )
+        self.export.refresh_from_db()
+        self.assertEqual(self.export.attempts, 1)
+        self.assertIsNone(self.export.failed_at)
+        self.assertEqual(list(Export.objects.claimable()), [])
+
+    @patch('osis_export.tests.export_test.async_manager.AsyncTaskManager.get_pending_job_uuids')
+    @patch('osis_export.tests.export_test.async_manager.AsyncTaskManager.update')
+    @patch('osis_export.tests.export_test.views.TestViewSearch.post_export_done', create=True)
+    def test_generate_export_fails_when_post_export_done_fails(self, post_export_done, update, pending_job_uuids):
+        pending_job_uuids.return_value = [self.export.job_uuid]
+        post_export_done.side_effect = Exception("Something went wrong")
+
+        call_command("generate_export_file")
+        self.assertEqual([c[1]["state"] for c in update.call_args_list], [TaskState.PROCESSING, TaskState.ERROR])
+        self.export.refresh_from_db()
+        self.assertIsNotNone(self.export.failed_at)
+
+    @patch('osis_export.tests.export_test.async_manager.AsyncTaskManager.get_pending_job_uuids')
+    @patch('osis_export.tests.export_test.async_manager.AsyncTaskManager.update')
+    @patch('osis_export.tests.export_test.views.TestViewSearch.generate_file')
+    @patch('osis_export.models.Export.schedule_retry')
+    def test_generate_export_does_not_stop_when_failure_can_not_be_recorded(
+        self,
+        schedule_retry,
+        generate_file,
+        update,
+        pending_job_uuids,
+    ):
+        pending_job_uuids.return_value = [self.export.job_uuid, self.export_2.job_uuid]
+        generate_file.side_effect = [OperationalError("Database unavailable"), b"content"]
+        schedule_retry.side_effect = OperationalError("Database unavailable")
+
+        call_command("generate_export_file")
+        # the failed export is claimed again once its lease expired
+        self.assertEqual([c[1]["state"] for c in update.call_args_list].count(TaskState.DONE), 1)
+        failed = Export.objects.filter(pk__in=[self.export.pk, self.export_2.pk], generated_at__isnull=True).get()
+        self.assertIsNotNone(failed.leased_until)
+        self.assertIsNone(failed.failed_at)
+
+    @patch('osis_export.tests.export_test.async_manager.AsyncTaskManager.get_pending_job_uuids')
+    @patch('osis_export.tests.export_test.async_manager.AsyncTaskManager.update')
+    def test_generate_export_ignores_failing_export_generated_receivers(self, update, pending_job_uuids):
+        pending_job_uuids.return_value = [self.export.job_uuid]
+        receiver = Mock(side_effect=Exception("Monitoring unavailable"))
+        export_generated.connect(receiver)
+        self.addCleanup(export_generated.disconnect, receiver)
+
+        with self.assertLogs(level="ERROR"):
+            call_command("generate_export_file")
+        receiver.assert_called_once()
+        update.assert_called_with(self.export.job_uuid, progression=100, state=TaskState.DONE, completed_at=ANY)
+
+    @patch('osis_export.tests.export_test.async_manager.AsyncTaskManager.get_pending_job_uuids')
+    @patch('osis_export.tests.export_test.async_manager.AsyncTaskManager.update')
+    @patch('osis_export.tests.export_test.views.TestViewSearch.generate_file')
+    def test_generate_export_does_not_stop_on_error(self, generate_file, update, pending_job_uuids):
+        pending_job_uuids.return_value = [
+            self.export.job_uuid,
+            self.export_2.job_uuid,
+        ]
+        generate_file.side_effect = [Exception("Something went wrong"), b"content"]
+
+        call_command("generate_export_file")
+        done_job_uuids = [c[0][0] for c in update.call_args_list if c[1]["state"] == TaskState.DONE]
+        error_job_uuids = [c[0][0] for c in update.call_args_list if c[1]["state"] == TaskState.ERROR]
+        self.assertEqual(len(done_job_uuids), 1)
+        self.assertEqual(len(error_job_uuids), 1)
+        self.assertNotEqual(done_job_uuids, error_job_uuids)
+
+    @patch('osis_export.tests.export_test.async_manager.AsyncTaskManager.get_pending_job_uuids')
+    @patch('osis_export.tests.export_test.async_manager.AsyncTaskManager.update')
+    def test_generate_export_interrupted_is_claimed_again_once_lease_expired(self, update, pending_job_uuids):
+        # the task states really change, the export is no longer pending once its generation started
+        states = {self.export.job_uuid: TaskState.PENDING}
+        pending_job_uuids.side_effect = lambda: [uuid for uuid, state in states.items() if state == TaskState.PENDING]
+        update.side_effect = lambda uuid, state=None, **kwargs: states.update({uuid: state or states[uuid]})
+
+        # the worker is killed while generating the export
+        with patch.object(TestViewSearch, "generate_file", side_effect=KeyboardInterrupt):
+            with self.assertRaises(KeyboardInterrupt):
+                call_command("generate_export_file")
+        self.assertEqual(states[self.export.job_uuid], TaskState.PROCESSING)
+        self.assertEqual(list(Export.objects.claimable()), [])
+
+        Export.objects.filter(pk=self.export.pk).update(leased_until=timezone.now())
+        self.assertEqual(list(Export.objects.claimable()), [self.export])
+        call_command("generate_export_file")
+        self.assertEqual(states[self.export.job_uuid], TaskState.DONE)
+        self.export.refresh_from_db()
+        self.assertIsNotNone(self.export.generated_at)
+        Export.objects.filter(pk=self.export.pk).update(leased_until=timezone.now())
+        self.assertEqual(list(Export.objects.claimable()), [])
+
+    @patch('osis_export.tests.export_test.async_manager.AsyncTaskManager.get_pending_job_uuids')
+    @patch('osis_export.tests.export_test.async_manager.AsyncTaskManager.update')
+    def test_generate_export_stops_when_lease_is_lost(self, update, pending_job_uuids):
+        pending_job_uuids.return_value = [self.export.job_uuid]
+        other_lease = timezone.now() + datetime.timedelta(hours=1)
+
+        def generate_file(view, *args, **kwargs):
+            # the lease expired, and another generation claimed the export meanwhile
+            Export.objects.filter(pk=self.export.pk).update(leased_until=other_lease)
+            view.export_progress.callback(50)
+
+        with patch.object(TestViewSearch, "generate_file", autospec=True, side_effect=generate_file):
             call_command("generate_export_file")
+        self.assertNotIn(TaskState.DONE, [c[1].get("state") for c in update.call_args_list])
+        self.assertNotIn(TaskState.ERROR, [c[1].get("state") for c in update.call_args_list])
+        self.export.refresh_from_db()
+        # left untouched for the generation that claimed it
+        self.assertEqual(self.export.leased_until, other_lease)
+        self.assertEqual(self.export.attempts, 0)
+        self.assertIsNone(self.export.failed_at)
+        self.assertIsNone(self.export.generated_at)
+
+    @patch('osis_export.tests.export_test.async_manager.AsyncTaskManager.get_pending_job_uuids')
+    @patch('osis_export.tests.export_test.async_manager.AsyncTaskManager.update')
+    @patch('osis_export.management.commands.generate_export_file.save_file_remotely')
+    @override_settings(OSIS_EXPORT_MAX_ATTEMPTS=2, OSIS_EXPORT_RETRY_DELAY=datetime.timedelta(minutes=1))
+    def test_generate_export_retries_on_transient_errors(self, save_file, update, pending_job_uuids):
+        pending_job_uuids.return_value = [self.export.job_uuid]
+        save_file.side_effect = RemoteUploadUnavailable("Upload failed")
+
+        call_command("generate_export_file")
+        update.assert_called_with(self.export.job_uuid, progression=0, state=TaskState.PENDING)
+        self.export.refresh_from_db()
+        self.assertEqual(self.export.attempts, 1)
+        self.assertIsNone(self.export.failed_at)
+        self.assertGreater(self.export.leased_until, timezone.now() + datetime.timedelta(seconds=50))
+        # not claimable before its retry delay is over
+        self.assertEqual(list(Export.objects.claimable()), [])
+
+        Export.objects.filter(pk=self.export.pk).update(leased_until=timezone.now())
+        call_command("generate_export_file")
         update.assert_called_with(self.export.job_uuid, progression=0, state=TaskState.ERROR)
+        self.export.refresh_from_db()
+        self.assertEqual(self.export.attempts, 2)
+        self.assertIsNotNone(self.export.failed_at)
+
+
+class TestCleanupExports(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.recent_export = ExportFactory()
+        cls.expired_exports = [ExportFactory() for _ in range(3)]
+        cls.leased_export = ExportFactory()
+        old = timezone.now() - datetime.timedelta(days=16)
+        Export.objects.filter(pk__in=[export.pk for export in cls.expired_exports]).update(created_at=old)
+        Export.objects.filter(pk=cls.leased_export.pk).update(
+            created_at=old,
+            leased_until=timezone.now() + datetime.timedelta(minutes=5),
+        )
+
+    def setUp(self):
+        snapshot_root = tempfile.TemporaryDirectory()
+        self.addCleanup(snapshot_root.cleanup)
+        settings_override = override_settings(OSIS_EXPORT_SNAPSHOT_ROOT=snapshot_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.snapshot_root = snapshot_root.name
+
+    def test_cleanup_exports_deletes_expired_exports_by_batch(self):
+        stdout = io.StringIO()
+        with patch.object(Export.objects, "expired", wraps=Export.objects.expired) as expired:
+            call_command("cleanup_exports", "--batch-size", "2", stdout=stdout)
+        # 2 batches, then nothing left
+        self.assertEqual(expired.call_count, 3)
+        self.assertCountEqual(Export.objects.all(), [self.recent_export, self.leased_export])
+        self.assertIn("Deleted 3 expired export(s)", stdout.getvalue())
+
+    @override_settings(OSIS_EXPORT_RETENTION_AGE=datetime.timedelta(days=30))
+    def test_cleanup_exports_keeps_exports_for_the_retention_age(self):
+        call_command("cleanup_exports", stdout=io.StringIO())
+        self.assertEqual(Export.objects.count(), 5)
+
+    @override_settings(OSIS_EXPORT_RETENTION_AGE=datetime.timedelta(days=1))
+    def test_cleanup_exports_keeps_exports_until_their_file_expires(self):
+        call_command("cleanup_exports", stdout=io.StringIO())
+        self.assertEqual(Export.objects.count(), 2)
+        Export.objects.filter(pk=self.recent_export.pk).update(created_at=timezone.now() - datetime.timedelta(days=2))
+        call_command("cleanup_exports", stdout=io.StringIO())
+        self.assertEqual(Export.objects.count(), 2)
+
+    def test_cleanup_exports_deletes_expired_snapshots(self):
+        expired_snapshot = os.path.join(self.snapshot_root, "expired.jsonl.gz")
+        recent_snapshot = os.path.join(self.snapshot_root, "recent.jsonl.gz")
+        for path in [expired_snapshot, recent_snapshot]:
+            with open(path, "wb"):
+                pass
+        old = (timezone.now() - datetime.timedelta(days=8)).timestamp()
+        os.utime(expired_snapshot, (old, old))
+        stdout = io.StringIO()
+        call_command("cleanup_exports", stdout=stdout)
+        self.assertEqual(os.listdir(self.snapshot_root), ["recent.jsonl.gz"])
+        self.assertIn("1 expired snapshot(s)", stdout.getvalue())
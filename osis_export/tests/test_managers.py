@@ -1,11 +1,14 @@
 import copy
 import datetime
+import uuid
 from unittest.mock import patch
 
 from django.test import TestCase, override_settings
+from django.utils import timezone
 
 from base.tests.factories.person import PersonFactory
 from osis_export.models import Export
+from osis_export.tests.export_test.models import DummyModel
 
 
 @override_settings(
@@ -22,7 +25,7 @@ class TestManager(TestCase):
             "state": "PENDING",
             "created_at": datetime.datetime.now(),
         }
-        Export.objects.create(
+        cls.export = Export.objects.create(
             job_uuid=cls.async_task.get("uuid"),
             person=cls.async_task.get("person"),
         )
@@ -47,3 +50,119 @@ class TestManager(TestCase):
             "87cb32fe-008f-4999-bd47-e7426e43006c",  # Not existing, or from another app
         ]
         self.assertEqual(Export.objects.not_generated().count(), 0)
+
+    @patch('osis_export.tests.export_test.async_manager.AsyncTaskManager.get_pending_job_uuids')
+    def test_export_manager_not_generated_uses_pending_job_uuids_subquery(self, pending_job_uuids):
+        # stands for the queryset of the pending async tasks uuids
+        pending_job_uuids.return_value = Export.objects.filter(pk=self.export.pk).values_list("job_uuid", flat=True)
+        queryset = Export.objects.claimable()
+        self.assertEqual(str(queryset.query).count("SELECT"), 2)
+        with self.assertNumQueries(1):
+            self.assertEqual(list(queryset), [self.export])
+
+    @patch('osis_export.tests.export_test.async_manager.AsyncTaskManager.get_pending_job_uuids')
+    def test_export_manager_claim_leases_pending_exports(self, pending_job_uuids):
+        pending_job_uuids.return_value = ["2043550d-839e-4acd-b67f-2fff4ab3faea"]
+        self.assertEqual(Export.objects.claimable().count(), 1)
+        claimed = Export.objects.claim()
+        self.assertEqual(claimed, [self.export])
+        self.assertIsNotNone(claimed[0].leased_until)
+        # an overlapping run can not claim it again
+        self.assertEqual(Export.objects.claimable().count(), 0)
+        self.assertEqual(Export.objects.claim(), [])
+
+    @patch('osis_export.tests.export_test.async_manager.AsyncTaskManager.get_pending_job_uuids')
+    def test_export_manager_claim_expired_lease(self, pending_job_uuids):
+        pending_job_uuids.return_value = ["2043550d-839e-4acd-b67f-2fff4ab3faea"]
+        Export.objects.update(leased_until=timezone.now() - datetime.timedelta(seconds=1))
+        # the generation of the processing export was interrupted
+        self.assertCountEqual(Export.objects.claimable(), Export.objects.all())
+        Export.objects.exclude(pk=self.export.pk).update(generated_at=timezone.now())
+        self.assertEqual(Export.objects.claim(), [self.export])
+
+    @patch('osis_export.tests.export_test.async_manager.AsyncTaskManager.get_pending_job_uuids')
+    def test_export_manager_claim_given_exports(self, pending_job_uuids):
+        pending_job_uuids.return_value = ["2043550d-839e-4acd-b67f-2fff4ab3faea"]
+        self.assertEqual(Export.objects.claim(export_ids=[self.export.pk + 1]), [])
+        self.assertEqual(Export.objects.claim(export_ids=[self.export.pk]), [self.export])
+
+    @patch('osis_export.tests.export_test.async_manager.AsyncTaskManager.get_pending_job_uuids')
+    def test_export_manager_claims_by_priority_then_cost(self, pending_job_uuids):
+        person = self.async_task.get("person")
+        big = Export.objects.create(job_uuid=uuid.uuid4(), person=person, estimated_cost=1000)
+        small = Export.objects.create(job_uuid=uuid.uuid4(), person=person, estimated_cost=10)
+        urgent = Export.objects.create(job_uuid=uuid.uuid4(), person=person, estimated_cost=5000, priority=1)
+        pending_job_uuids.return_value = [self.export.job_uuid, big.job_uuid, small.job_uuid, urgent.job_uuid]
+        # not estimated exports are claimed last
+        self.assertEqual(list(Export.objects.claimable()), [urgent, small, big, self.export])
+        self.assertEqual(Export.objects.claim(limit=2), [urgent, small])
+
+    @patch('osis_export.tests.export_test.async_manager.AsyncTaskManager.get_pending_job_uuids')
+    def test_export_manager_claims_within_cost_range(self, pending_job_uuids):
+        person = self.async_task.get("person")
+        big = Export.objects.create(job_uuid=uuid.uuid4(), person=person, estimated_cost=1000)
+        small = Export.objects.create(job_uuid=uuid.uuid4(), person=person, estimated_cost=10)
+        pending_job_uuids.return_value = [self.export.job_uuid, big.job_uuid, small.job_uuid]
+        self.assertEqual(Export.objects.claim(min_cost=1000), [big])
+        # not estimated exports are considered the smallest
+        self.assertEqual(Export.objects.claim(max_cost=1000), [small, self.export])
+
+    @patch('osis_export.tests.export_test.async_manager.AsyncTaskManager.get_pending_job_uuids')
+    def test_export_manager_generating(self, pending_job_uuids):
+        pending_job_uuids.return_value = [self.export.job_uuid]
+        processing = Export.objects.exclude(pk=self.export.pk).get()
+        self.assertEqual(Export.objects.generating().count(), 0)
+        Export.objects.claim()
+        # still pending, claimed only
+        self.assertEqual(Export.objects.generating().count(), 0)
+        Export.objects.update(leased_until=timezone.now() + datetime.timedelta(minutes=1))
+        self.assertEqual(list(Export.objects.generating()), [processing])
+        processing.generated_at = timezone.now()
+        processing.save()
+        self.assertEqual(Export.objects.generating().count(), 0)
+
+    @patch('osis_export.tests.export_test.async_manager.AsyncTaskManager.get_pending_job_uuids')
+    def test_export_renew_lease(self, pending_job_uuids):
+        pending_job_uuids.return_value = [self.export.job_uuid]
+        export = Export.objects.claim()[0]
+        leased_until = export.leased_until
+        self.assertTrue(export.renew_lease())
+        self.assertGreaterEqual(export.leased_until, leased_until)
+        # claimed by another generation once expired
+        Export.objects.update(leased_until=timezone.now() - datetime.timedelta(seconds=1))
+        Export.objects.claim()
+        self.assertFalse(export.renew_lease())
+        self.assertNotEqual(Export.objects.get(pk=export.pk).leased_until, export.leased_until)
+
+    def test_export_estimate_cost(self):
+        DummyModel.objects.create(name="dummy")
+        DummyModel.objects.create(name="another dummy")
+        self.export.called_from_class = "osis_export.tests.export_test.views.TestViewSearch"
+        self.export.filters = "name=dummy"
+        self.assertEqual(self.export.estimate_cost(), 1)
+        self.export.refresh_from_db()
+        self.assertEqual(self.export.estimated_cost, 1)
+
+    @override_settings(OSIS_EXPORT_RESULT_CACHE_TTL=datetime.timedelta(hours=1))
+    def test_export_manager_cached_result(self):
+        self.export.result_fingerprint = self.export.get_result_fingerprint("en", "v1")
+        self.export.save()
+        self.assertEqual(Export.objects.cached_result(self.export.result_fingerprint), self.export)
+        Export.objects.update(created_at=timezone.now() - datetime.timedelta(hours=2))
+        self.assertIsNone(Export.objects.cached_result(self.export.result_fingerprint))
+
+    def test_export_result_fingerprint_normalizes_filters(self):
+        export = Export(called_from_class="A", type="EXCEL", filters="b=2&a=1&c=", person=self.export.person)
+        other_export = Export(called_from_class="A", type="EXCEL", filters="a=1&b=2", person=self.export.person)
+        self.assertEqual(
+            export.get_result_fingerprint("en", "v1"),
+            other_export.get_result_fingerprint("en", "v1"),
+        )
+        self.assertNotEqual(
+            export.get_result_fingerprint("en", "v1"),
+            other_export.get_result_fingerprint("en", "v2"),
+        )
+        self.assertNotEqual(
+            export.get_result_fingerprint("en", "v1"),
+            other_export.get_result_fingerprint("fr-be", "v1"),
+        )
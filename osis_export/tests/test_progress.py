@@ -0,0 +1,32 @@
+from unittest.mock import Mock, patch
+
+from django.test import SimpleTestCase
+
+from osis_export.contrib.progress import ExportProgress
+
+
+class TestExportProgress(SimpleTestCase):
+    def test_progression_is_reported_every_rows(self):
+        callback = Mock()
+        progress = ExportProgress(total=100, callback=callback, every_rows=25, interval=0)
+        for _ in range(100):
+            progress.advance()
+        self.assertEqual([c[0][0] for c in callback.call_args_list], [25, 50, 74, 99])
+
+    @patch("osis_export.contrib.progress.time.monotonic")
+    def test_progression_is_reported_every_interval(self, monotonic):
+        monotonic.return_value = 0
+        callback = Mock()
+        progress = ExportProgress(total=100, callback=callback, every_rows=1, interval=10)
+        progress.advance(50)
+        callback.assert_not_called()
+        monotonic.return_value = 10
+        progress.advance()
+        callback.assert_called_once_with(50)
+
+    def test_progression_is_not_reported_without_total(self):
+        callback = Mock()
+        progress = ExportProgress(callback=callback, every_rows=1, interval=0)
+        progress.advance(10)
+        callback.assert_not_called()
+        self.assertEqual(progress.count, 10)
@@ -0,0 +1,64 @@
+import datetime
+import decimal
+import gzip
+import os
+import tempfile
+import uuid
+from unittest.mock import patch
+
+from django.test import SimpleTestCase, override_settings
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+
+from osis_export.contrib.snapshots import ExportSnapshot
+
+
+class TestExportSnapshot(SimpleTestCase):
+    def setUp(self):
+        snapshot_root = tempfile.TemporaryDirectory()
+        self.addCleanup(snapshot_root.cleanup)
+        self.snapshot_root = os.path.join(snapshot_root.name, "snapshots")
+        settings_override = override_settings(OSIS_EXPORT_SNAPSHOT_ROOT=self.snapshot_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_save_and_load_values_as_is(self):
+        watermark = timezone.now()
+        rows = [
+            ["name", 1, 1.5, True, None, decimal.Decimal("1.10")],
+            [datetime.date(2023, 1, 2), datetime.time(12, 30), watermark, uuid.UUID(int=1), gettext_lazy("Yes")],
+        ]
+        ExportSnapshot(watermark, [1, 2], rows).save("key")
+        snapshot = ExportSnapshot.load("key")
+        self.assertEqual(snapshot.watermark, watermark)
+        self.assertEqual(snapshot.pks, [1, 2])
+        self.assertEqual(snapshot.rows, rows[:1] + [rows[1][:4] + [str(rows[1][4])]])
+        self.assertIsInstance(snapshot.rows[0][5], decimal.Decimal)
+        self.assertEqual(os.stat(self.snapshot_root).st_mode & 0o777, 0o700)
+
+    def test_stores_json_lines(self):
+        ExportSnapshot(3, [1], [["name"]]).save("key")
+        with gzip.open(ExportSnapshot.get_path("key"), "rt") as file:
+            self.assertEqual(file.read(), '{"watermark": 3}\n[1, ["name"]]\n')
+
+    def test_does_not_save_values_that_can_not_be_stored(self):
+        ExportSnapshot(3, [1], [[object()]]).save("key")
+        self.assertIsNone(ExportSnapshot.load("key"))
+        self.assertEqual(os.listdir(self.snapshot_root), [])
+
+    def test_ignores_invalid_snapshots(self):
+        os.makedirs(self.snapshot_root)
+        with gzip.open(ExportSnapshot.get_path("key"), "wb") as file:
+            file.write(b"\x80\x04not json")
+        self.assertIsNone(ExportSnapshot.load("key"))
+
+    @patch("osis_export.contrib.snapshots.os.getuid", create=True)
+    def test_ignores_snapshots_of_other_users(self, getuid):
+        ExportSnapshot(3, [1], [["name"]]).save("key")
+        getuid.return_value = os.stat(ExportSnapshot.get_path("key")).st_uid + 1
+        self.assertIsNone(ExportSnapshot.load("key"))
+
+    @override_settings(OSIS_EXPORT_SNAPSHOT_MAX_AGE=datetime.timedelta(seconds=-1))
+    def test_ignores_expired_snapshots(self):
+        ExportSnapshot(3, [1], [["name"]]).save("key")
+        self.assertIsNone(ExportSnapshot.load("key"))
@@ -0,0 +1,98 @@
+import datetime
+from unittest.mock import call, patch
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from osis_export.models import Export
+from osis_export.tasks.generate_export_file import dispatch, dispatch_workers, generate, run
+from osis_export.tests.factory import ExportFactory
+
+
+@override_settings(
+    OSIS_EXPORT_ASYNCHRONOUS_MANAGER_CLS="osis_export.tests.export_test.async_manager.AsyncTaskManager",
+)
+@patch('osis_export.tasks.generate_export_file.generate.apply_async')
+@patch('osis_export.tests.export_test.async_manager.AsyncTaskManager.get_pending_job_uuids')
+class TestDispatchWorkers(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.exports = [ExportFactory(estimated_cost=10) for _ in range(3)]
+
+    @override_settings(OSIS_EXPORT_GENERATION_CONCURRENCY=2)
+    def test_dispatches_sub_tasks_generating_all_pending_exports(self, pending_job_uuids, apply_async):
+        pending_job_uuids.return_value = [export.job_uuid for export in self.exports]
+        run()
+        self.assertEqual(apply_async.call_count, 2)
+        apply_async.assert_called_with(kwargs={"min_cost": None, "max_cost": None}, expires=60)
+
+    def test_dispatches_no_more_sub_tasks_than_pending_exports(self, pending_job_uuids, apply_async):
+        pending_job_uuids.return_value = [self.exports[0].job_uuid]
+        dispatch_workers(concurrency=4)
+        self.assertEqual(apply_async.call_count, 1)
+
+    def test_counts_the_exports_being_generated(self, pending_job_uuids, apply_async):
+        pending_job_uuids.return_value = [export.job_uuid for export in self.exports[1:]]
+        # the first export is being generated by a sub-task dispatched by a previous run
+        Export.objects.filter(pk=self.exports[0].pk).update(
+            leased_until=timezone.now() + datetime.timedelta(minutes=1),
+        )
+        dispatch_workers(concurrency=2)
+        self.assertEqual(apply_async.call_count, 1)
+        apply_async.reset_mock()
+        Export.objects.filter(pk=self.exports[1].pk).update(
+            leased_until=timezone.now() + datetime.timedelta(minutes=1),
+        )
+        pending_job_uuids.return_value = [self.exports[2].job_uuid]
+        dispatch_workers(concurrency=2)
+        apply_async.assert_not_called()
+
+    @override_settings(OSIS_EXPORT_LARGE_EXPORT_THRESHOLD=100, OSIS_EXPORT_LARGE_EXPORT_QUEUE="large_exports")
+    def test_dispatches_large_exports_to_their_queue(self, pending_job_uuids, apply_async):
+        large = ExportFactory(estimated_cost=1000)
+        pending_job_uuids.return_value = [self.exports[0].job_uuid, large.job_uuid]
+        dispatch_workers(concurrency=1)
+        self.assertEqual(
+            apply_async.call_args_list,
+            [
+                call(kwargs={"min_cost": None, "max_cost": 100}, expires=60),
+                call(kwargs={"min_cost": 100, "max_cost": None}, expires=60, queue="large_exports"),
+            ],
+        )
+
+
+    @override_settings(OSIS_EXPORT_LARGE_EXPORT_THRESHOLD=100, OSIS_EXPORT_LARGE_EXPORT_QUEUE="large_exports")
+    def test_dispatches_new_exports_without_estimating_their_cost(self, pending_job_uuids, apply_async):
+        export = ExportFactory()
+        pending_job_uuids.return_value = [export.job_uuid]
+        with patch.object(Export, "estimate_cost") as estimate_cost:
+            dispatch([export])
+            dispatch_workers(concurrency=1)
+        estimate_cost.assert_not_called()
+        # not estimated exports are considered the smallest, a generation found too large is left to the large queue
+        self.assertEqual(
+            apply_async.call_args_list,
+            [
+                call(args=[[export.pk]], kwargs={"max_cost": 100}),
+                call(kwargs={"min_cost": None, "max_cost": 100}, expires=60),
+            ],
+        )
+
+@patch('osis_export.tasks.generate_export_file.call_command')
+class TestGenerate(TestCase):
+    def test_generates_pending_exports_within_cost_range(self, call_command):
+        generate(min_cost=100)
+        call_command.assert_called_once_with(
+            "generate_export_file", export=[], batch_size=10, min_cost=100, max_cost=None
+        )
+
+    def test_generates_given_exports(self, call_command):
+        generate([1, 2])
+        call_command.assert_called_once_with(
+            "generate_export_file", export=[1, 2], batch_size=10, min_cost=None, max_cost=None
+        )
+
+    @override_settings(OSIS_EXPORT_GENERATION_BATCH_SIZE=5)
+    def test_generates_pending_exports_by_batches(self, call_command):
+        run()
+        call_command.assert_called_once_with("generate_export_file", batch_size=5)
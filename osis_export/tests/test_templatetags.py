@@ -94,3 +94,18 @@ class TestTemplateTags(TestCase):
             "<input type='hidden' name='file_name' value='this-file-name-must-be-slugged-e-eaac' id='id_file_name'>",
             rendered_template,
         )
+
+    def test_export_task_tag_with_csv_type(self):
+        template_to_render = Template(
+            "{% load export %}"
+            "{% export_task file_type='CSV' name='test name' description='test description' %}"
+        )
+        rendered_template = template_to_render.render(self.context)
+        self.assertInHTML(
+            "<input type='hidden' name='type' value='CSV' id='id_type'>",
+            rendered_template,
+        )
+        self.assertInHTML(
+            "<button type='submit' class='btn btn-default'>Export dans un fichier CSV</button>",
+            rendered_template,
+        )
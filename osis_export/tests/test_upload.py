@@ -0,0 +1,107 @@
+import json
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from unittest.mock import patch
+
+from django.test import SimpleTestCase, override_settings
+
+from osis_export.contrib.upload import RemoteUploadError, RemoteUploadUnavailable, save_file_remotely
+
+
+class DocumentServerHandler(BaseHTTPRequestHandler):
+    """Stand-in for the upload endpoint of OSIS Document, answering with the queued statuses"""
+
+    def do_POST(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        server.requests.append((self.path, dict(self.headers), body))
+        status = server.statuses.pop(0) if server.statuses else 201
+        content = json.dumps({"token": "foobar"}).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@patch("osis_export.contrib.upload.time.sleep")
+class TestSaveFileRemotely(SimpleTestCase):
+    def setUp(self):
+        self.server = HTTPServer(("127.0.0.1", 0), DocumentServerHandler)
+        self.server.requests = []
+        self.server.statuses = []
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+        settings_override = override_settings(
+            OSIS_DOCUMENT_BASE_URL="http://127.0.0.1:{}/".format(self.server.server_port),
+            OSIS_DOCUMENT_API_SHARED_SECRET="secret",
+            OSIS_EXPORT_UPLOAD_CHUNK_SIZE=1024,
+            OSIS_EXPORT_UPLOAD_RETRIES=2,
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.file = tempfile.TemporaryFile()
+        self.file.write(b"x" * 10000)
+        self.addCleanup(self.file.close)
+
+    def test_streams_file_as_multipart_upload(self, sleep):
+        token = save_file_remotely(self.file, 'my "export".csv', "text/csv")
+        self.assertEqual(token, "foobar")
+        path, headers, body = self.server.requests[0]
+        self.assertEqual(path, "/request-upload")
+        self.assertEqual(headers["X-Api-Key"], "secret")
+        self.assertEqual(int(headers["Content-Length"]), len(body))
+        self.assertNotIn("Transfer-Encoding", headers)
+        boundary = headers["Content-Type"].split("boundary=")[1].encode()
+        self.assertTrue(body.startswith(b"--" + boundary + b"\r\n"))
+        self.assertIn(b'name="file"; filename="my %22export%22.csv"', body)
+        self.assertIn(b"Content-Type: text/csv\r\n\r\n" + b"x" * 10000 + b"\r\n--" + boundary + b"--", body)
+        sleep.assert_not_called()
+
+    def test_retries_on_server_errors(self, sleep):
+        self.server.statuses = [503, 502]
+        self.assertEqual(save_file_remotely(self.file, "export.csv", "text/csv"), "foobar")
+        self.assertEqual(len(self.server.requests), 3)
+        # the whole file is sent again on each attempt
+        for _, _, body in self.server.requests:
+            self.assertIn(b"\r\n\r\n" + b"x" * 10000 + b"\r\n", body)
+        self.assertEqual([c[0][0] for c in sleep.call_args_list], [1, 2])
+
+    def test_fails_after_retries(self, sleep):
+        self.server.statuses = [500, 500, 500]
+        with self.assertRaises(RemoteUploadUnavailable):
+            save_file_remotely(self.file, "export.csv", "text/csv")
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_retries_when_throttled(self, sleep):
+        self.server.statuses = [429, 408]
+        self.assertEqual(save_file_remotely(self.file, "export.csv", "text/csv"), "foobar")
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_fails_when_throttled_after_retries(self, sleep):
+        self.server.statuses = [429, 429, 429]
+        with self.assertRaises(RemoteUploadUnavailable):
+            save_file_remotely(self.file, "export.csv", "text/csv")
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_does_not_retry_invalid_upload(self, sleep):
+        self.server.statuses = [400]
+        with self.assertRaises(RemoteUploadError) as context:
+            save_file_remotely(self.file, "export.csv", "text/csv")
+        self.assertNotIsInstance(context.exception, RemoteUploadUnavailable)
+        self.assertEqual(len(self.server.requests), 1)
+
+    @patch("osis_export.contrib.upload.save_raw_content_remotely", return_value="token")
+    def test_uploads_bytes_with_osis_document(self, save_raw_content, sleep):
+        self.assertEqual(save_file_remotely(b"content", "export.csv", "text/csv"), "token")
+        save_raw_content.assert_called_once_with(b"content", "export.csv", "text/csv")
+        self.assertEqual(self.server.requests, [])
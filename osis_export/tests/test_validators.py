@@ -1,8 +1,13 @@
+from unittest.mock import patch
+
 from django.core.exceptions import ValidationError
 from django.test import TestCase
+from django.utils.module_loading import import_string
 
 from base.tests.factories.person import PersonFactory
+from osis_export.contrib.registry import get_class, is_export_class
 from osis_export.models import Export
+from osis_export.models.validators import validate_export_mixin_inheritance
 
 
 class TestValidators(TestCase):
@@ -46,3 +51,20 @@ class TestValidators(TestCase):
         }
         export = Export(**export_data)
         export.full_clean()
+
+    def test_called_from_class_validation_raises_error_if_not_a_class(self):
+        with self.assertRaises(ValidationError):
+            validate_export_mixin_inheritance("osis_export.contrib.registry.get_class")
+
+    def test_called_from_class_validation_is_memoized(self):
+        get_class.cache_clear()
+        is_export_class.cache_clear()
+        with patch("osis_export.contrib.registry.import_string", wraps=import_string) as mock_import_string:
+            for _ in range(3):
+                validate_export_mixin_inheritance("osis_export.tests.export_test.views.TestViewSearch")
+                get_class("osis_export.tests.export_test.views.TestViewSearch")
+            for _ in range(2):
+                with self.assertRaises(ValidationError):
+                    validate_export_mixin_inheritance("osis_export.tests.export_test.views.DoesNotExist")
+        # the missing classes are not memoized
+        self.assertEqual(mock_import_string.call_count, 3)
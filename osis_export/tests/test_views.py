@@ -1,23 +1,40 @@
+import csv
+import datetime
+import gzip
+import importlib.util
+import io
+import tempfile
 import uuid
+import zipfile
+from unittest import skipUnless
 from unittest.mock import patch
 
 from django.core.exceptions import ImproperlyConfigured, ValidationError
-from django.core.files.base import ContentFile
+from django.db.models import QuerySet
 from django.test import TestCase, override_settings
 from django.urls import reverse
+from django_filters.views import FilterView
 from openpyxl import load_workbook
 from openpyxl.styles import Font
+from openpyxl.worksheet._writer import ALL_TEMP_FILES
 from openpyxl.worksheet.worksheet import Worksheet
 
 from base.tests.factories.person import PersonFactory
 from osis_export.contrib.export_mixins import (
+    CsvFileExportMixin,
+    CsvFilterSetExportMixin,
     ExcelFileExportMixin,
+    ExcelFilterSetExportMixin,
+    ExportColumn,
     ExportMixin,
     FileExportMixin,
+    ParquetFileExportMixin,
+    ParquetFilterSetExportMixin,
+    QuerySetExportMixin,
 )
 from osis_export.models import Export
 from osis_export.tests.export_test.models import DummyModel
-from osis_export.tests.export_test.views import TestViewSearch
+from osis_export.tests.export_test.views import DummyFilter, TestViewSearch
 
 
 @override_settings(
@@ -130,6 +147,54 @@ class TestAsyncExport(TestCase):
             time_to_live=42,
         )
 
+    @patch('osis_export.tasks.generate_export_file.generate.apply_async')
+    @patch('osis_export.tests.export_test.async_manager.AsyncTaskManager.create')
+    def test_async_export_view_does_not_dispatch_generation_by_default(self, create_task, apply_async):
+        create_task.return_value = uuid.uuid4()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(self.url, self.export_data)
+        apply_async.assert_not_called()
+
+    @override_settings(OSIS_EXPORT_GENERATE_ON_CREATION=True)
+    @patch('osis_export.tasks.generate_export_file.generate.apply_async')
+    @patch('osis_export.tests.export_test.async_manager.AsyncTaskManager.create')
+    def test_async_export_view_dispatches_generation_on_creation(self, create_task, apply_async):
+        create_task.return_value = uuid.uuid4()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(self.url, self.export_data)
+        export = Export.objects.get()
+        apply_async.assert_called_once_with(args=[[export.pk]])
+
+    @override_settings(OSIS_EXPORT_GENERATE_ON_CREATION=True)
+    @patch('osis_export.tasks.generate_export_file.generate.apply_async')
+    @patch('osis_export.tests.export_test.async_manager.AsyncTaskManager.create')
+    def test_async_export_view_ignores_dispatch_errors(self, create_task, apply_async):
+        create_task.return_value = uuid.uuid4()
+        apply_async.side_effect = ConnectionError("Broker unavailable")
+        with self.assertLogs(level="ERROR"), self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(self.url, self.export_data)
+        self.assertEqual(response.status_code, 302)
+        # left to the periodic task
+        self.assertEqual(Export.objects.count(), 1)
+
+    @patch('osis_export.tests.export_test.async_manager.AsyncTaskManager.create')
+    def test_async_export_view_sets_request_fingerprint(self, create_task):
+        create_task.side_effect = lambda **kwargs: uuid.uuid4()
+        self.client.post(self.url, self.export_data)
+        self.client.post(self.url, {**self.export_data, "file_name": "another file name"})
+        self.client.post(self.url, {**self.export_data, "filters": "name=foo"})
+        exports = Export.objects.order_by("pk")
+        self.assertNotEqual(exports[0].request_fingerprint, "")
+        self.assertEqual(exports[0].request_fingerprint, exports[1].request_fingerprint)
+        self.assertNotEqual(exports[0].request_fingerprint, exports[2].request_fingerprint)
+
+    @patch('osis_export.tests.export_test.async_manager.AsyncTaskManager.create')
+    def test_async_export_view_sets_priority_from_view(self, create_task):
+        create_task.return_value = uuid.uuid4()
+        with patch.object(TestViewSearch, "export_priority", 5):
+            self.client.post(self.url, self.export_data)
+        self.assertEqual(Export.objects.get().priority, 5)
+
 
 class TestFileExportMixin(TestCase):
     @classmethod
@@ -185,8 +250,9 @@ class TestExcelFileExportMixin(TestCase):
 
     def test_generate_file_creates_excel_file(self):
         file = self.my_class_instance.generate_file(person=None, filters='')
-        self.assertEqual(type(file), bytes)
-        workbook = load_workbook(ContentFile(file))
+        # the file is streamed back, ready to be read
+        self.assertEqual(file.tell(), 0)
+        workbook = load_workbook(file)
         worksheet = workbook.active
         # check if the first row is in bold style
         cells = worksheet.iter_rows(min_row=1, max_row=1)
@@ -209,6 +275,441 @@ class TestExcelFileExportMixin(TestCase):
             for cell in col:
                 self.assertEqual(cell.value, self.my_object.test_param_4)
 
+    def test_generate_file_in_write_only_mode_creates_excel_file(self):
+        self.my_class_instance.write_only = True
+        self.my_class_instance.with_parameters_worksheet = True
+        file = self.my_class_instance.generate_file(person=None, filters='')
+        workbook = load_workbook(file)
+        self.assertEqual(len(workbook.worksheets), 2)
+        worksheet = workbook.worksheets[0]
+        # check that we have 11 rows : 1 for the header and 10 for data
+        self.assertEqual(worksheet.max_row, 11)
+        for cell in worksheet[1]:
+            self.assertEqual(cell.font, Font(bold=True))
+        for cell in worksheet[2]:
+            self.assertFalse(cell.font.bold)
+
+    def test_generate_file_in_write_only_mode_by_default(self):
+        self.assertTrue(self.my_class_instance.is_write_only())
+
+        class CustomizedClass(type(self.my_class_instance)):
+            def customize_workbook_before_save(self, workbook):
+                workbook.active.freeze_panes = "A2"
+
+        view = CustomizedClass()
+        self.assertFalse(view.is_write_only())
+        worksheet = load_workbook(view.generate_file(person=None, filters='')).active
+        self.assertEqual(worksheet.freeze_panes, "A2")
+        view.write_only = True
+        self.assertTrue(view.is_write_only())
+
+    def test_generate_file_in_write_only_mode_deletes_worksheets_on_error(self):
+        temp_files = list(ALL_TEMP_FILES)
+        with patch.object(type(self.my_class_instance), "get_row_data", side_effect=ValueError):
+            with self.assertRaises(ValueError):
+                self.my_class_instance.generate_file(person=None, filters='')
+        self.assertEqual(ALL_TEMP_FILES, temp_files)
+
+    def test_generate_file_splits_rows_into_worksheets(self):
+        for write_only in [False, True]:
+            self.my_class_instance.write_only = write_only
+            self.my_class_instance.max_rows_per_sheet = 4
+            self.my_class_instance.description = "Data"
+            file = self.my_class_instance.generate_file(person=None, filters='')
+            workbook = load_workbook(file)
+            self.assertEqual(workbook.sheetnames, ["Data", "Data (2)", "Data (3)"])
+            self.assertEqual([worksheet.max_row for worksheet in workbook.worksheets], [5, 5, 3])
+            for worksheet in workbook.worksheets:
+                self.assertEqual(worksheet["A1"].value, "test param")
+        self.assertEqual(
+            [cell.value for cell in worksheet[2]],
+            [self.my_object.test_param, self.my_object.test_param_2, self.my_object.test_param_4],
+        )
+
+
+class TestCsvFileExportMixin(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        class MyClass(ExportMixin, CsvFileExportMixin):
+            def get_export_objects(self, **kwargs):
+                return [{"name": "name {}".format(i), "value": i} for i in range(10)]
+
+            def get_header(self):
+                return ["name", "value"]
+
+            def get_row_data(self, row):
+                return [row["name"], row["value"]]
+
+        cls.my_class_instance = MyClass()
+        cls.expected_rows = [["name", "value"]] + [["name {}".format(i), str(i)] for i in range(10)]
+
+    def test_generate_file_creates_csv_file(self):
+        file = self.my_class_instance.generate_file(person=None, filters='')
+        # the file is streamed back, ready to be read
+        self.assertEqual(file.tell(), 0)
+        self.assertEqual(list(csv.reader(io.StringIO(file.read().decode()))), self.expected_rows)
+        self.assertEqual(self.my_class_instance.get_file_extension(), ".csv")
+        self.assertEqual(self.my_class_instance.get_mimetype(), "text/csv")
+
+    def test_generate_file_flushes_rows_in_file(self):
+        self.my_class_instance.buffer_size = 1
+        self.my_class_instance.csv_delimiter = ";"
+        file = self.my_class_instance.generate_file(person=None, filters='')
+        self.assertEqual(list(csv.reader(io.StringIO(file.read().decode()), delimiter=";")), self.expected_rows)
+
+    def test_generate_file_formats_rows_by_batch(self):
+        self.my_class_instance.export_batch_size = 4
+        with patch.object(
+            self.my_class_instance,
+            "get_rows_data",
+            wraps=self.my_class_instance.get_rows_data,
+        ) as get_rows_data:
+            file = self.my_class_instance.generate_file(person=None, filters='')
+        self.assertEqual([len(c[0][0]) for c in get_rows_data.call_args_list], [4, 4, 2])
+        self.assertEqual(list(csv.reader(io.StringIO(file.read().decode()))), self.expected_rows)
+
+    def test_generate_file_creates_compressed_csv_file(self):
+        self.my_class_instance.gzip_compression = True
+        file = self.my_class_instance.generate_file(person=None, filters='')
+        self.assertEqual(list(csv.reader(io.StringIO(gzip.decompress(file.read()).decode()))), self.expected_rows)
+        self.assertEqual(self.my_class_instance.get_file_extension(), ".csv.gz")
+        self.assertEqual(self.my_class_instance.get_mimetype(), "application/gzip")
+
+    def test_generate_export_file_without_archive(self):
+        file = self.my_class_instance.generate_export_file(person=None, filters='', file_name="export")
+        self.assertEqual(list(csv.reader(io.StringIO(file.read().decode()))), self.expected_rows)
+        self.assertEqual(self.my_class_instance.get_export_file_extension(), ".csv")
+        self.assertEqual(self.my_class_instance.get_export_mimetype(), "text/csv")
+
+    def test_generate_export_file_in_zip_archive(self):
+        self.my_class_instance.zip_archive = True
+        file = self.my_class_instance.generate_export_file(person=None, filters='', file_name="export")
+        with zipfile.ZipFile(file) as archive:
+            self.assertEqual(archive.namelist(), ["export.csv"])
+            content = archive.read("export.csv").decode()
+        self.assertEqual(list(csv.reader(io.StringIO(content))), self.expected_rows)
+        self.assertEqual(self.my_class_instance.get_export_file_extension(), ".zip")
+        self.assertEqual(self.my_class_instance.get_export_mimetype(), "application/zip")
+
+    def test_generate_export_file_in_zip64_archive(self):
+        self.my_class_instance.zip_archive = True
+        file = self.my_class_instance.generate_export_file(person=None, filters='', file_name="export")
+        with zipfile.ZipFile(file) as archive:
+            header_offset = archive.getinfo("export.csv").header_offset
+        file.seek(header_offset)
+        local_header = file.read(30)
+        # the sizes are stored in the zip64 extra field, so that they may exceed 4 GiB
+        self.assertEqual(local_header[18:26], b"\xff" * 8)
+
+    def test_generate_export_file_splits_rows_into_files(self):
+        self.my_class_instance.max_rows_per_file = 4
+        file = self.my_class_instance.generate_export_file(person=None, filters='', file_name="export")
+        self.assertEqual(self.my_class_instance.get_export_file_extension(), ".zip")
+        with zipfile.ZipFile(file) as archive:
+            self.assertEqual(archive.namelist(), ["export-1.csv", "export-2.csv", "export-3.csv"])
+            parts = [list(csv.reader(io.StringIO(archive.read(name).decode()))) for name in archive.namelist()]
+        self.assertEqual(parts[0], self.expected_rows[:5])
+        self.assertEqual(parts[1], self.expected_rows[:1] + self.expected_rows[5:9])
+        self.assertEqual(parts[2], self.expected_rows[:1] + self.expected_rows[9:])
+        self.assertEqual(self.my_class_instance.export_metrics.row_count, 10)
+
+    def test_generate_export_file_splits_no_rows_into_a_file(self):
+        self.my_class_instance.max_rows_per_file = 4
+        with patch.object(self.my_class_instance, "get_export_objects", return_value=[]):
+            file = self.my_class_instance.generate_export_file(person=None, filters='', file_name="export")
+        with zipfile.ZipFile(file) as archive:
+            self.assertEqual(archive.namelist(), ["export-1.csv"])
+            self.assertEqual(archive.read("export-1.csv").decode().splitlines(), ["name,value"])
+
+
+@skipUnless(importlib.util.find_spec("pyarrow"), "pyarrow is not installed")
+class TestParquetFileExportMixin(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        class MyClass(ExportMixin, ParquetFileExportMixin):
+            def get_export_objects(self, **kwargs):
+                return [{"name": "name {}".format(i), "value": i, "empty": None} for i in range(10)]
+
+            def get_header(self):
+                return ["name", "value", "empty"]
+
+            def get_row_data(self, row):
+                return [row["name"], row["value"], row["empty"]]
+
+        cls.my_class_instance = MyClass()
+
+    def test_generate_file_creates_parquet_file(self):
+        from pyarrow import parquet
+
+        self.my_class_instance.export_batch_size = 4
+        file = self.my_class_instance.generate_file(person=None, filters='')
+        self.assertEqual(file.tell(), 0)
+        parquet_file = parquet.ParquetFile(file)
+        # a row group per batch of rows
+        self.assertEqual(parquet_file.metadata.num_row_groups, 3)
+        self.assertEqual(
+            parquet_file.read().to_pydict(),
+            {
+                "name": ["name {}".format(i) for i in range(10)],
+                "value": list(range(10)),
+                "empty": [None] * 10,
+            },
+        )
+        self.assertEqual(str(parquet_file.schema_arrow.field("empty").type), "string")
+        self.assertEqual(self.my_class_instance.get_file_extension(), ".parquet")
+
+    def test_generate_file_from_columns(self):
+        from pyarrow import parquet
+
+        for cpt in range(3):
+            DummyModel.objects.create(name="dummy-name-{}".format(cpt), selectable_value="A")
+
+        class ColumnsViewSearch(ParquetFilterSetExportMixin, FilterView):
+            filterset_class = DummyFilter
+            export_columns = [
+                ExportColumn("name", "Name"),
+                ExportColumn("selectable_value", "Value", formatter=str.lower),
+            ]
+
+        file = ColumnsViewSearch().generate_file(person=None, filters="selectable_value=B")
+        self.assertEqual(parquet.read_table(file).to_pydict(), {"Name": [], "Value": []})
+        file = ColumnsViewSearch().generate_file(person=None, filters="")
+        self.assertEqual(
+            parquet.read_table(file).to_pydict(),
+            {"Name": ["dummy-name-{}".format(cpt) for cpt in range(3)], "Value": ["a"] * 3},
+        )
+
+    def test_generate_file_with_column_empty_in_first_batch(self):
+        from pyarrow import parquet
+
+        self.my_class_instance.export_batch_size = 4
+        with patch.object(
+            self.my_class_instance,
+            "get_row_data",
+            lambda row: [row["name"], row["value"], None if row["value"] < 4 else row["value"]],
+        ):
+            file = self.my_class_instance.generate_file(person=None, filters='')
+        self.assertEqual(
+            parquet.read_table(file).to_pydict()["empty"],
+            [None] * 4 + [str(i) for i in range(4, 10)],
+        )
+
+    def test_generate_file_fails_when_values_do_not_fit_column_type(self):
+        self.my_class_instance.export_batch_size = 4
+        # integers in the first batch, then floats
+        with patch.object(
+            self.my_class_instance,
+            "get_row_data",
+            lambda row: [row["name"], row["value"] if row["value"] < 4 else row["value"] + 0.5, None],
+        ):
+            with self.assertRaisesMessage(ImproperlyConfigured, "'value' column"):
+                self.my_class_instance.generate_file(person=None, filters='')
+
+    def test_generate_file_from_columns_with_types_of_model_fields(self):
+        from pyarrow import parquet
+
+        DummyModel.objects.create(name="dummy-name", selectable_value="A")
+
+        class ColumnsViewSearch(ParquetFilterSetExportMixin, FilterView):
+            filterset_class = DummyFilter
+            export_columns = [
+                ExportColumn("pk", "Id"),
+                ExportColumn("name", "Name"),
+                ExportColumn("selectable_value", "Value", formatter=len),
+            ]
+
+        file = ColumnsViewSearch().generate_file(person=None, filters="selectable_value=B")
+        schema = parquet.ParquetFile(file).schema_arrow
+        # known without any row
+        self.assertEqual(str(schema.field("Id").type), "int64")
+        self.assertEqual(str(schema.field("Name").type), "string")
+        self.assertEqual(str(schema.field("Value").type), "string")
+        file = ColumnsViewSearch().generate_file(person=None, filters="")
+        table = parquet.read_table(file)
+        self.assertEqual(table.to_pydict()["Value"], [1])
+        self.assertEqual(str(table.schema.field("Value").type), "int64")
+
+    def test_generate_file_requires_pyarrow(self):
+        with patch.dict("sys.modules", {"pyarrow": None, "pyarrow.parquet": None}):
+            with self.assertRaises(ImproperlyConfigured):
+                self.my_class_instance.generate_file(person=None, filters='')
+
+
+class TestExportColumns(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        for cpt in range(3):
+            DummyModel.objects.create(name="dummy-name-{}".format(cpt), selectable_value="A")
+
+        class ColumnsViewSearch(ExcelFilterSetExportMixin, FilterView):
+            filterset_class = DummyFilter
+            export_columns = [
+                ExportColumn("name", "Name"),
+                ExportColumn("selectable_value", "Value", formatter=str.lower),
+            ]
+
+        cls.my_class_instance = ColumnsViewSearch()
+
+    def test_generate_file_from_columns(self):
+        with self.assertNumQueries(1):
+            file = self.my_class_instance.generate_file(person=None, filters="")
+        worksheet = load_workbook(file).active
+        self.assertEqual(
+            [[cell.value for cell in row] for row in worksheet.iter_rows()],
+            [
+                ["Name", "Value"],
+                ["dummy-name-0", "a"],
+                ["dummy-name-1", "a"],
+                ["dummy-name-2", "a"],
+            ],
+        )
+
+    def test_columns_require_a_queryset(self):
+        class MyClass(QuerySetExportMixin, ExcelFileExportMixin):
+            export_columns = [ExportColumn("name", "Name")]
+
+            def get_queryset_export(self, filters):
+                return []
+
+        with self.assertRaises(ImproperlyConfigured):
+            MyClass().generate_file(person=None, filters="")
+
+    def test_columns_require_a_queryset_export_mixin(self):
+        class MyClass(ExportMixin, ExcelFileExportMixin):
+            export_columns = [ExportColumn("name", "Name")]
+
+            def get_export_objects(self, **kwargs):
+                return DummyModel.objects.all()
+
+        with self.assertRaises(ImproperlyConfigured):
+            MyClass().generate_file(person=None, filters="")
+
+    def test_fields_are_not_given_to_get_export_objects(self):
+        class MyClass(ExportMixin, ExcelFileExportMixin):
+            def get_export_objects(self, filters, person):
+                return [DummyModel(name=filters)]
+
+            def get_header(self):
+                return ["Name"]
+
+            def get_row_data(self, row):
+                return [row.name]
+
+        file = MyClass().generate_file(person=None, filters="dummy")
+        worksheet = load_workbook(file).active
+        self.assertEqual([[cell.value for cell in row] for row in worksheet.iter_rows()], [["Name"], ["dummy"]])
+
+
+class TestIncrementalExport(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        for cpt in range(5):
+            DummyModel.objects.create(name="dummy-name-{}".format(cpt), selectable_value="A")
+
+    def setUp(self):
+        snapshot_root = tempfile.TemporaryDirectory()
+        self.addCleanup(snapshot_root.cleanup)
+        settings_override = override_settings(OSIS_EXPORT_SNAPSHOT_ROOT=snapshot_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        class IncrementalViewSearch(CsvFilterSetExportMixin, FilterView):
+            filterset_class = DummyFilter
+            export_change_tracking_field = "pk"
+            export_columns = [
+                ExportColumn("name", "Name"),
+                ExportColumn("selectable_value", "Value"),
+            ]
+
+        self.view_class = IncrementalViewSearch
+
+    def generate(self, filters=""):
+        view = self.view_class()
+        file = view.generate_file(person=None, filters=filters)
+        return list(csv.reader(io.StringIO(file.read().decode()))), view.export_metrics
+
+    def test_generate_file_reuses_unchanged_rows(self):
+        rows, metrics = self.generate()
+        self.assertEqual(len(rows), 6)
+        self.assertEqual(metrics.row_count, 5)
+        self.assertEqual(metrics.reused_row_count, 0)
+
+        DummyModel.objects.filter(name="dummy-name-1").delete()
+        DummyModel.objects.create(name="dummy-name-5", selectable_value="B")
+        rows, metrics = self.generate()
+        self.assertEqual(
+            rows,
+            [["Name", "Value"]] + [["dummy-name-{}".format(cpt), "A"] for cpt in [0, 2, 3, 4]] + [["dummy-name-5", "B"]],
+        )
+        self.assertEqual(metrics.row_count, 5)
+        # only the latest row of the previous export and the new one are read again
+        self.assertEqual(metrics.reused_row_count, 3)
+
+    def test_generate_file_reads_again_objects_changed_within_the_lag(self):
+        self.view_class.export_change_tracking_lag = 2
+        self.generate()
+        # e.g. committed after the previous export, with an older value of the tracked field
+        DummyModel.objects.filter(name="dummy-name-3").update(selectable_value="C")
+        DummyModel.objects.filter(name="dummy-name-1").update(selectable_value="C")
+        rows, metrics = self.generate()
+        self.assertIn(["dummy-name-3", "C"], rows)
+        # older than the lag
+        self.assertIn(["dummy-name-1", "A"], rows)
+        self.assertEqual(metrics.reused_row_count, 2)
+
+    @override_settings(OSIS_EXPORT_SNAPSHOT_LAG=datetime.timedelta(minutes=10))
+    def test_change_tracking_lag_of_dates(self):
+        view = self.view_class()
+        self.assertEqual(view.get_change_tracking_lag(datetime.datetime(2024, 1, 1)), datetime.timedelta(minutes=10))
+        self.assertIsNone(view.get_change_tracking_lag(42))
+
+    def test_generate_file_from_objects_reuses_unchanged_rows(self):
+        class ObjectsViewSearch(self.view_class):
+            export_columns = None
+
+            def get_header(self):
+                return ["Name"]
+
+            def get_row_data(self, row):
+                return [row.name.upper()]
+
+        self.view_class = ObjectsViewSearch
+        self.generate()
+        DummyModel.objects.create(name="dummy-name-5", selectable_value="B")
+        rows, metrics = self.generate()
+        self.assertEqual(rows, [["Name"]] + [["DUMMY-NAME-{}".format(cpt)] for cpt in range(6)])
+        self.assertEqual(metrics.reused_row_count, 4)
+
+    def test_generate_file_keeps_a_snapshot_per_filters(self):
+        self.generate()
+        rows, metrics = self.generate(filters="selectable_value=B")
+        self.assertEqual(rows, [["Name", "Value"]])
+        self.assertEqual(metrics.reused_row_count, 0)
+
+    def test_generate_file_reads_again_rows_of_objects_not_exported(self):
+        self.generate(filters="selectable_value=B")
+        DummyModel.objects.filter(name="dummy-name-1").update(selectable_value="B")
+        rows, metrics = self.generate(filters="selectable_value=B")
+        self.assertEqual(rows, [["Name", "Value"], ["dummy-name-1", "B"]])
+
+    @override_settings(OSIS_EXPORT_SNAPSHOT_ROOT=None)
+    def test_incremental_export_requires_a_snapshot_root(self):
+        with self.assertRaises(ImproperlyConfigured):
+            self.generate()
+
+    def test_incremental_export_requires_a_queryset(self):
+        class MyClass(ExportMixin, CsvFileExportMixin):
+            export_change_tracking_field = "pk"
+
+            def get_export_objects(self, **kwargs):
+                return []
+
+            def get_header(self):
+                return ["Name"]
+
+        with self.assertRaises(ImproperlyConfigured):
+            MyClass().generate_file(person=None, filters="")
+
 
 class TestFilterSetExportMixin(TestCase):
     @classmethod
@@ -233,6 +734,33 @@ class TestFilterSetExportMixin(TestCase):
         qs = self.my_class_instance.get_export_objects(filters="name=dummy-name-2")
         self.assertEqual(qs.count(), 1)
 
+    def test_iter_export_objects_uses_a_chunked_iterator(self):
+        with patch.object(
+            QuerySet, "iterator", autospec=True, side_effect=lambda qs, chunk_size: iter(qs)
+        ) as iterator:
+            objects = list(self.my_class_instance.iter_export_objects(filters=""))
+        self.assertEqual(len(objects), self.dummy_objects_count)
+        iterator.assert_called_once()
+        self.assertEqual(iterator.call_args[1], {"chunk_size": TestViewSearch.export_chunk_size})
+
+    def test_iter_export_objects_without_chunk_size(self):
+        self.my_class_instance.export_chunk_size = None
+        with patch.object(QuerySet, "iterator") as iterator:
+            objects = list(self.my_class_instance.iter_export_objects(filters=""))
+        self.assertEqual(len(objects), self.dummy_objects_count)
+        iterator.assert_not_called()
+
+    @patch("django.VERSION", (3, 2, 0, "final", 0))
+    def test_iter_export_objects_with_prefetched_objects_before_django_4_1(self):
+        with patch.object(
+            TestViewSearch,
+            "get_queryset_export",
+            lambda view, filters: Export.objects.prefetch_related("person"),
+        ), patch.object(QuerySet, "iterator") as iterator:
+            self.my_class_instance.iter_export_objects(filters="")
+        # the related objects are still prefetched
+        iterator.assert_not_called()
+
     def test_raises_validation_error_if_filterset_is_not_valid(self):
         with self.assertRaises(ValidationError):
             self.my_class_instance.get_queryset_export("selectable_value=Z")